@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import List, Dict, Optional
+from config import settings
+
+def normalize_question(question: str) -> str:
+    """Canonical form of a question for cache keys"""
+    question = unicodedata.normalize("NFKC", question).lower()
+    question = re.sub(r"\s+", " ", question).strip()
+    return question.rstrip("?.! ")
+
+class AnswerCache:
+    """Cache of generated answers.
+
+    Keys combine the document content hash, the normalized question, the ids
+    of the chunks retrieved for it, the model configuration and the prompt
+    version, so an answer is only reused when the LLM would have seen the
+    same input. The memory tier is a bounded LRU; with
+    settings.answer_cache_persist the answers also go to a SQLite file under
+    settings.cache_dir.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.max_entries = settings.answer_cache_max_entries
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+        if settings.answer_cache_persist:
+            self.path = path or os.path.join(settings.cache_dir, "answers.sqlite3")
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._conn = sqlite3.connect(self.path, check_same_thread=False)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS answers ("
+                    "key TEXT PRIMARY KEY, answer TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+                self._conn.commit()
+            except Exception as e:
+                print(f"Warning: Answer cache persistence unavailable: {e}")
+                self._conn = None
+
+    def __len__(self) -> int:
+        return len(self._memory)
+
+    @staticmethod
+    def make_key(document_hash: str, question: str, chunk_ids: List[str],
+                 model: str, prompt_version: str) -> str:
+        payload = json.dumps(
+            [document_hash, normalize_question(question), sorted(chunk_ids), model, prompt_version],
+            separators=(",", ":")
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, str]:
+        """Look up answers, checking memory then disk"""
+        found = {}
+        with self._lock:
+            for key in keys:
+                answer = self._memory.get(key)
+                if answer is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = answer
+
+            missing = [key for key in keys if key not in found]
+            if missing and self._conn is not None:
+                placeholders = ",".join("?" * len(missing))
+                rows = self._conn.execute(
+                    f"SELECT key, answer FROM answers WHERE key IN ({placeholders})", missing
+                ).fetchall()
+                for key, answer in rows:
+                    found[key] = answer
+                    self._remember(key, answer)
+                self.stats["disk_hits"] += len(rows)
+            hits = sum(1 for key in keys if key in found)
+            self.stats["hits"] += hits
+            self.stats["misses"] += len(keys) - hits
+        return found
+
+    def put_many(self, items: Dict[str, str]):
+        """Store answers keyed by cache key"""
+        if not items:
+            return
+        with self._lock:
+            for key, answer in items.items():
+                self._remember(key, answer)
+            self.stats["writes"] += len(items)
+            if self._conn is not None:
+                now = time.time()
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO answers (key, answer, created_at) VALUES (?, ?, ?)",
+                    [(key, answer, now) for key, answer in items.items()]
+                )
+                self._conn.commit()
+
+    def get_info(self) -> Dict[str, object]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "entries": len(self._memory),
+            "max_entries": self.max_entries,
+            "persistent": self._conn is not None,
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            **self.stats
+        }
+
+    def _remember(self, key: str, answer: str):
+        self._memory[key] = answer
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
@@ -0,0 +1,222 @@
+import re
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Tuple
+from app.models import DocumentChunk
+from app.tokenizer import count_tokens
+from config import settings
+
+# Short lines that open a new section: "Section 4", "3.1 Grace Period", "EXCLUSIONS".
+# The keyword must be capitalised, so a wrapped line starting "schedule of ..." is not one
+HEADING_PATTERN = re.compile(
+    r"^(?:(?=[A-Z])(?i:section|clause|article|part|chapter|schedule|annexure|appendix)\b[^.;,]{0,60}"
+    r"|\d+(?:\.\d+)*[.)]?\s+[A-Z][^.;]{0,80}"
+    r"|[A-Z][A-Z0-9 ,&/()\-]{3,80})$"
+)
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+CLAUSE_BOUNDARY = re.compile(r"(?<=[;:,])\s+")
+WORD_BOUNDARY = re.compile(r"\s+")
+LINE_PATTERN = re.compile(r"[^\n]+")
+
+@dataclass
+class _Unit:
+    """A sentence, clause or heading: document offsets plus its token count"""
+    start: int
+    end: int
+    tokens: int
+    page: int
+    heading: bool
+    section: Optional[str]
+
+def _strip_span(text: str, start: int, end: int) -> Tuple[int, int]:
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+def _split_spans(text: str, start: int, end: int, pattern: re.Pattern) -> List[Tuple[int, int]]:
+    """Split text[start:end] at pattern matches into stripped, non-empty spans"""
+    spans = []
+    position = start
+    for match in pattern.finditer(text, start, end):
+        spans.append(_strip_span(text, position, match.start()))
+        position = match.end()
+    spans.append(_strip_span(text, position, end))
+    return [(s, e) for s, e in spans if e > s]
+
+def segment_page(text: str) -> Iterator[Tuple[int, int, bool]]:
+    """Yield (start, end, is_heading) for the headings and sentences of a page.
+
+    Extracted PDF text wraps lines wherever the layout did, so a single line
+    break continues the paragraph; only blank lines and headings end it.
+    """
+    block_start = block_end = None
+    previous_end = 0
+    for match in LINE_PATTERN.finditer(text):
+        start, end = _strip_span(text, match.start(), match.end())
+        line = text[start:end]
+        blank_before = text.count("\n", previous_end, match.start()) > 1
+        previous_end = match.end()
+        if block_start is not None and (not line or blank_before or HEADING_PATTERN.match(line)):
+            # Blank lines and headings close the current paragraph
+            for span in _split_spans(text, block_start, block_end, SENTENCE_BOUNDARY):
+                yield span[0], span[1], False
+            block_start = None
+        if not line:
+            continue
+        if HEADING_PATTERN.match(line):
+            yield start, end, True
+            continue
+        if block_start is None:
+            block_start = start
+        block_end = end
+    if block_start is not None:
+        for span in _split_spans(text, block_start, block_end, SENTENCE_BOUNDARY):
+            yield span[0], span[1], False
+
+class StructuredChunker:
+    """Incremental, token-sized chunker that respects document structure.
+
+    Pages are fed in order as cleaned text that keeps its line breaks. Each
+    page is segmented into headings and sentences. Sentences are packed into
+    chunks of at most chunk_size tokens, and a sentence that is too long on
+    its own is split at clause and then word boundaries. A heading always
+    starts a new chunk, and one that ends the document with no text after
+    it is dropped. Consecutive chunks within a section share up to
+    chunk_overlap tokens of whole sentences.
+
+    Offsets refer to the document text formed by joining the fed pages with
+    "\\n". Every chunk's content is exactly that text's [char_start, char_end)
+    slice. Only the text of the chunk currently being filled is kept.
+    """
+
+    def __init__(self, chunk_size: Optional[int] = None, chunk_overlap: Optional[int] = None):
+        self.chunk_size = chunk_size or settings.chunk_size
+        self.chunk_overlap = settings.chunk_overlap if chunk_overlap is None else chunk_overlap
+        self.chunk_count = 0
+        self._text = ""
+        self._base = 0
+        self._length = 0
+        self._units: List[_Unit] = []
+        self._tokens = 0
+        self._section: Optional[str] = None
+
+    def feed(self, page_number: int, text: str) -> List[DocumentChunk]:
+        """Add one page of cleaned text and return any chunks it completed"""
+        if self._length:
+            self._append("\n")
+        page_offset = self._length
+        self._append(text)
+
+        chunks = []
+        for start, end, heading in segment_page(text):
+            if heading:
+                chunks.extend(self._add_heading(page_number, page_offset + start, page_offset + end, text[start:end]))
+                continue
+            for piece_start, piece_end, tokens in self._pieces(text, start, end):
+                chunks.extend(self._add(_Unit(
+                    page_offset + piece_start, page_offset + piece_end, tokens,
+                    page_number, False, self._section
+                )))
+        self._trim()
+        return chunks
+
+    def flush(self) -> List[DocumentChunk]:
+        """Return the final partial chunk, if any"""
+        if not self._units:
+            return []
+        if self.chunk_count and all(unit.heading for unit in self._units):
+            # A trailing heading with no text under it would be a chunk of its own
+            self._units = []
+            self._tokens = 0
+            self._trim()
+            return []
+        chunk = self._emit(carry_overlap=False)
+        self._trim()
+        return [chunk]
+
+    # Internals
+
+    def _append(self, text: str):
+        self._text += text
+        self._length += len(text)
+
+    def _trim(self):
+        """Drop text that no pending unit refers to"""
+        keep_from = self._units[0].start if self._units else self._length
+        self._text = self._text[keep_from - self._base:]
+        self._base = keep_from
+
+    def _pieces(self, text: str, start: int, end: int) -> List[Tuple[int, int, int]]:
+        """Split an oversized sentence at clause, then word, boundaries and repack"""
+        tokens = count_tokens(text[start:end])
+        if tokens <= self.chunk_size:
+            return [(start, end, tokens)]
+        for pattern in (CLAUSE_BOUNDARY, WORD_BOUNDARY):
+            spans = _split_spans(text, start, end, pattern)
+            if len(spans) > 1:
+                break
+        else:
+            return [(start, end, tokens)]
+
+        pieces = []
+        for span_start, span_end in spans:
+            for piece in self._pieces(text, span_start, span_end):
+                if pieces and pieces[-1][2] + piece[2] <= self.chunk_size:
+                    pieces[-1] = (pieces[-1][0], piece[1], pieces[-1][2] + piece[2])
+                else:
+                    pieces.append(piece)
+        return pieces
+
+    def _add_heading(self, page_number: int, start: int, end: int, title: str) -> List[DocumentChunk]:
+        chunks = []
+        if any(not unit.heading for unit in self._units):
+            chunks.append(self._emit(carry_overlap=False))
+        self._section = title
+        self._units.append(_Unit(start, end, count_tokens(title), page_number, True, title))
+        self._tokens += self._units[-1].tokens
+        return chunks
+
+    def _add(self, unit: _Unit) -> List[DocumentChunk]:
+        chunks = []
+        if self._tokens + unit.tokens > self.chunk_size and any(not u.heading for u in self._units):
+            chunks.append(self._emit(carry_overlap=True))
+            # Shrink the overlap rather than push this unit over the limit
+            while self._units and self._tokens + unit.tokens > self.chunk_size:
+                self._tokens -= self._units.pop(0).tokens
+        self._units.append(unit)
+        self._tokens += unit.tokens
+        return chunks
+
+    def _emit(self, carry_overlap: bool) -> DocumentChunk:
+        units = self._units
+        char_start, char_end = units[0].start, units[-1].end
+        content = self._text[char_start - self._base:char_end - self._base]
+        chunk = DocumentChunk(
+            content=content,
+            metadata={
+                "chunk_id": self.chunk_count,
+                "token_count": self._tokens,
+                "word_count": len(content.split()),
+                "char_count": len(content),
+                "char_start": char_start,
+                "char_end": char_end,
+                "page_start": units[0].page,
+                "page_end": units[-1].page,
+                "section": units[0].section or ""
+            }
+        )
+        self.chunk_count += 1
+
+        # Carry trailing whole sentences into the next chunk as overlap
+        carried: List[_Unit] = []
+        if carry_overlap:
+            budget = self.chunk_overlap
+            for unit in reversed(units[1:]):
+                if unit.heading or unit.tokens > budget:
+                    break
+                carried.insert(0, unit)
+                budget -= unit.tokens
+        self._units = carried
+        self._tokens = sum(unit.tokens for unit in carried)
+        return chunk
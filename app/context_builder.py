@@ -0,0 +1,68 @@
+from typing import List, Optional, Tuple
+from app.models import SearchResult
+from app.tokenizer import count_tokens, truncate_to_tokens
+
+CHUNK_SEPARATOR = "\n\n"
+
+def _span(result: SearchResult) -> Optional[Tuple[int, int]]:
+    start, end = result.metadata.get("char_start"), result.metadata.get("char_end")
+    if isinstance(start, int) and isinstance(end, int) and end > start:
+        return start, end
+    return None
+
+def _remove_overlap(result: SearchResult, spans: List[Tuple[int, int]]) -> Optional[str]:
+    """Chunk text minus any prefix or suffix already covered by selected chunks; None if fully covered"""
+    span = _span(result)
+    content = result.content
+    if span is None or len(content) != span[1] - span[0]:
+        return content
+    start, end = span
+    for other_start, other_end in spans:
+        if other_start <= start and end <= other_end:
+            return None
+        if other_start <= start < other_end:
+            start = other_end
+        elif start < other_start < end <= other_end:
+            end = other_start
+    text = content[start - span[0]:end - span[0]].strip()
+    return text or None
+
+def build_context(results: List[SearchResult], max_tokens: int, ordered: bool = False) -> str:
+    """Pack retrieved chunks, most relevant first, into at most max_tokens tokens.
+
+    Chunks are kept whole: identical chunks are dropped, text shared with an
+    already selected chunk (chunker overlap) is trimmed, and a chunk that
+    does not fit is skipped in favour of smaller, less relevant ones. Only
+    when not even the best chunk fits is it cut at a token boundary. With
+    ordered, results are taken in the given order instead of by score.
+    """
+    ranked = list(results) if ordered else sorted(results, key=lambda result: result.score, reverse=True)
+    separator_tokens = count_tokens(CHUNK_SEPARATOR)
+    seen = set()
+    spans: List[Tuple[int, int]] = []
+    parts: List[str] = []
+    used = 0
+
+    for result in ranked:
+        if result.content in seen:
+            continue
+        seen.add(result.content)
+        text = _remove_overlap(result, spans)
+        if text is None:
+            continue
+        if text == result.content and "token_count" in result.metadata:
+            tokens = result.metadata["token_count"]
+        else:
+            tokens = count_tokens(text)
+        cost = tokens + (separator_tokens if parts else 0)
+        if used + cost > max_tokens:
+            continue
+        parts.append(text)
+        used += cost
+        span = _span(result)
+        if span is not None:
+            spans.append(span)
+
+    if not parts and ranked:
+        parts.append(truncate_to_tokens(ranked[0].content, max_tokens))
+    return CHUNK_SEPARATOR.join(parts)
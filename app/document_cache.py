@@ -0,0 +1,264 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+from app.models import DocumentChunk
+from app.document_processor import chunking_signature
+from config import settings
+
+class DocumentCache:
+    """Two-tier cache of processed document chunks.
+
+    Entries are keyed by the SHA-256 of the downloaded bytes, so different
+    URLs serving the same file share one entry. A separate URL index maps
+    each URL to its content hash and HTTP validators for TTL/ETag
+    revalidation. The memory tier is an LRU bounded by entry count and text
+    size; the disk tier survives restarts and is bounded by total bytes.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        self.cache_dir = cache_dir or settings.cache_dir
+        self.documents_dir = os.path.join(self.cache_dir, "documents")
+        self.url_index_path = os.path.join(self.cache_dir, "urls.json")
+        self.max_entries = settings.document_cache_max_entries
+        self.max_bytes = settings.document_cache_max_bytes
+        self.disk_max_bytes = settings.document_cache_disk_max_bytes
+        self.ttl = settings.document_cache_ttl
+        self.max_urls = settings.document_cache_max_urls
+
+        self._lock = threading.RLock()
+        self._memory: "OrderedDict[str, List[DocumentChunk]]" = OrderedDict()
+        self._memory_sizes: Dict[str, int] = {}
+        self._memory_bytes = 0
+        self._urls: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "disk_evictions": 0,
+            "revalidations": 0,
+            "not_modified": 0
+        }
+
+        try:
+            os.makedirs(self.documents_dir, exist_ok=True)
+            self._load_url_index()
+        except Exception as e:
+            print(f"Warning: Document cache directory unavailable: {e}")
+
+    def __len__(self) -> int:
+        return len(self._memory)
+
+    # URL index
+
+    def lookup_url(self, url: str) -> Optional[Dict[str, Any]]:
+        """Return the cached record for a URL, if any"""
+        with self._lock:
+            record = self._urls.get(url)
+            if record is not None:
+                self._urls.move_to_end(url)
+            return dict(record) if record else None
+
+    def is_fresh(self, record: Dict[str, Any]) -> bool:
+        """Check whether a URL record is still within its TTL"""
+        fresh = time.time() - record.get("validated_at", 0) < self.ttl
+        if not fresh:
+            with self._lock:
+                self.stats["revalidations"] += 1
+        return fresh
+
+    def record_url(self, url: str, content_hash: str, etag: Optional[str] = None,
+                   last_modified: Optional[str] = None):
+        """Remember which content a URL served and how to revalidate it"""
+        with self._lock:
+            self._urls[url] = {
+                "content_hash": content_hash,
+                "etag": etag,
+                "last_modified": last_modified,
+                "validated_at": time.time()
+            }
+            self._urls.move_to_end(url)
+            while len(self._urls) > self.max_urls:
+                self._urls.popitem(last=False)
+            self._save_url_index()
+
+    def touch_url(self, url: str):
+        """Mark a URL as revalidated (the server answered 304 Not Modified)"""
+        with self._lock:
+            self.stats["not_modified"] += 1
+            if url in self._urls:
+                self._urls[url]["validated_at"] = time.time()
+                self._save_url_index()
+
+    # Content entries
+
+    def get(self, content_hash: str) -> Optional[List[DocumentChunk]]:
+        """Get chunks by content hash, checking memory then disk"""
+        with self._lock:
+            chunks = self._memory.get(content_hash)
+            if chunks is not None:
+                self._memory.move_to_end(content_hash)
+                self.stats["memory_hits"] += 1
+                return chunks
+
+        chunks = self._read_disk(content_hash)
+        with self._lock:
+            if chunks is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["disk_hits"] += 1
+            self._put_memory(content_hash, chunks)
+            return chunks
+
+    def put(self, content_hash: str, chunks: List[DocumentChunk]):
+        """Store chunks in both tiers"""
+        with self._lock:
+            self._put_memory(content_hash, chunks)
+        self._write_disk(content_hash, chunks)
+
+    def clear(self):
+        """Drop all memory and disk entries"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_sizes.clear()
+            self._memory_bytes = 0
+            self._urls.clear()
+            try:
+                for name in os.listdir(self.documents_dir):
+                    os.remove(os.path.join(self.documents_dir, name))
+                if os.path.exists(self.url_index_path):
+                    os.remove(self.url_index_path)
+            except Exception as e:
+                print(f"Warning: Failed to clear document cache: {e}")
+
+    def get_info(self) -> Dict[str, Any]:
+        """Summarize cache contents and hit statistics"""
+        with self._lock:
+            disk_entries, disk_bytes = self._disk_usage()
+            return {
+                "cache_size": len(self._memory),
+                "cached_documents": list(self._urls.keys()),
+                "memory": {
+                    "entries": len(self._memory),
+                    "bytes": self._memory_bytes,
+                    "max_entries": self.max_entries,
+                    "max_bytes": self.max_bytes
+                },
+                "disk": {
+                    "entries": disk_entries,
+                    "bytes": disk_bytes,
+                    "max_bytes": self.disk_max_bytes,
+                    "path": self.cache_dir
+                },
+                "ttl_seconds": self.ttl,
+                "stats": dict(self.stats)
+            }
+
+    # Internals
+
+    def _put_memory(self, content_hash: str, chunks: List[DocumentChunk]):
+        size = sum(len(chunk.content) for chunk in chunks)
+        if content_hash in self._memory:
+            self._memory_bytes -= self._memory_sizes[content_hash]
+        self._memory[content_hash] = chunks
+        self._memory_sizes[content_hash] = size
+        self._memory_bytes += size
+        self._memory.move_to_end(content_hash)
+
+        # Evict least recently used entries, always keeping the newest one
+        while len(self._memory) > 1 and (
+            len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes
+        ):
+            evicted, _ = self._memory.popitem(last=False)
+            self._memory_bytes -= self._memory_sizes.pop(evicted)
+            self.stats["evictions"] += 1
+
+    def _document_path(self, content_hash: str) -> str:
+        return os.path.join(self.documents_dir, f"{content_hash}.json")
+
+    def _read_disk(self, content_hash: str) -> Optional[List[DocumentChunk]]:
+        path = self._document_path(content_hash)
+        try:
+            if not os.path.exists(path):
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+            if payload.get("chunking") != chunking_signature():
+                return None
+            # Refresh mtime so disk eviction is least-recently-used
+            os.utime(path, None)
+            return [DocumentChunk(**chunk) for chunk in payload["chunks"]]
+        except Exception as e:
+            print(f"Warning: Failed to read cached document {content_hash}: {e}")
+            return None
+
+    def _write_disk(self, content_hash: str, chunks: List[DocumentChunk]):
+        path = self._document_path(content_hash)
+        try:
+            payload = {
+                "chunking": chunking_signature(),
+                "created_at": time.time(),
+                "chunks": [chunk.model_dump() for chunk in chunks]
+            }
+            self._atomic_write(path, json.dumps(payload))
+            self._evict_disk()
+        except Exception as e:
+            print(f"Warning: Failed to write cached document {content_hash}: {e}")
+
+    def _disk_entries(self) -> List[tuple]:
+        entries = []
+        if not os.path.isdir(self.documents_dir):
+            return entries
+        for name in os.listdir(self.documents_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.documents_dir, name)
+            try:
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+            except OSError:
+                continue
+        return entries
+
+    def _disk_usage(self) -> tuple:
+        entries = self._disk_entries()
+        return len(entries), sum(size for _, size, _ in entries)
+
+    def _evict_disk(self):
+        entries = sorted(self._disk_entries())
+        total = sum(size for _, size, _ in entries)
+        # Oldest first, always keeping the most recent entry
+        for _, size, path in entries[:-1]:
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                self.stats["disk_evictions"] += 1
+            except OSError:
+                continue
+
+    def _load_url_index(self):
+        if not os.path.exists(self.url_index_path):
+            return
+        try:
+            with open(self.url_index_path, "r", encoding="utf-8") as f:
+                self._urls = OrderedDict(json.load(f))
+        except Exception as e:
+            print(f"Warning: Failed to load document URL index: {e}")
+            self._urls = OrderedDict()
+
+    def _save_url_index(self):
+        try:
+            self._atomic_write(self.url_index_path, json.dumps(self._urls))
+        except Exception as e:
+            print(f"Warning: Failed to save document URL index: {e}")
+
+    def _atomic_write(self, path: str, data: str):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
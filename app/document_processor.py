@@ -1,60 +1,218 @@
-import requests
+import asyncio
+import httpx
+import math
+import multiprocessing
+import os
 import PyPDF2
 import io
+from concurrent.futures import ProcessPoolExecutor
 from docx import Document
-from typing import List, Dict, Any
+import hashlib
+from dataclasses import dataclass
+from typing import AsyncIterator, List, Dict, Any, Optional
 import re
 import mimetypes
 from app.models import DocumentChunk
+from app.chunker import StructuredChunker
+from app.http_client import get_http_client
+from app.metrics import timed
 from config import settings
 
+@dataclass
+class DownloadResult:
+    """Raw document bytes plus the HTTP validators needed to revalidate them"""
+    content: bytes
+    content_hash: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    not_modified: bool = False
+
+# Bump when chunk boundaries or metadata change so cached chunks and indexes are rebuilt
+CHUNKER_VERSION = "5"
+
+def chunking_signature() -> str:
+    """Chunks depend on the chunker version and settings; caches and indexes record the ones used"""
+    return f"{CHUNKER_VERSION}:{settings.chunk_size}:{settings.chunk_overlap}"
+
+# Shared process pool for PDF page extraction, created lazily
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+
+def _pdf_worker_count() -> int:
+    return settings.pdf_extract_workers or os.cpu_count() or 1
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    global _pdf_pool
+    if _pdf_pool is None:
+        # The server is multithreaded by now, and forking a threaded process can deadlock the child
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        _pdf_pool = ProcessPoolExecutor(max_workers=_pdf_worker_count(), mp_context=multiprocessing.get_context(method))
+    return _pdf_pool
+
+def shutdown_pdf_pool():
+    """Stop the PDF extraction worker processes"""
+    global _pdf_pool
+    if _pdf_pool is not None:
+        _pdf_pool.shutdown(wait=False, cancel_futures=True)
+        _pdf_pool = None
+
+def _count_pdf_pages(content: bytes) -> int:
+    return len(PyPDF2.PdfReader(io.BytesIO(content)).pages)
+
+def _extract_pdf_page_range(content: bytes, start: int, end: int) -> List[str]:
+    """Extract the text of pages [start, end); runs in a worker process"""
+    pdf_reader = PyPDF2.PdfReader(io.BytesIO(content))
+    return [pdf_reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+async def _single_page(text_future, stage: str) -> AsyncIterator[str]:
+    with timed(stage):
+        text = await text_future
+    yield text
+
 class DocumentProcessor:
     def __init__(self):
         self.supported_extensions = ['.pdf', '.docx', '.doc']
     
     async def download_document(self, url: str) -> bytes:
         """Download document from URL"""
+        result = await self.fetch_document(url)
+        return result.content
+    
+    async def fetch_document(self, url: str, etag: Optional[str] = None,
+                             last_modified: Optional[str] = None) -> DownloadResult:
+        """Download document from URL (timed as the "download" stage)"""
+        with timed("download"):
+            return await self._fetch_document(url, etag, last_modified)
+    
+    async def _fetch_document(self, url: str, etag: Optional[str] = None,
+                              last_modified: Optional[str] = None) -> DownloadResult:
+        """Download document from URL, streaming the body and enforcing the size limit.
+        
+        When validators from a previous download are passed, a conditional
+        request is made and a 304 response is reported as not_modified.
+        """
+        client = get_http_client()
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        
         try:
-            response = requests.get(url, timeout=30, stream=True)
-            response.raise_for_status()
-            
-            # Check content type
-            content_type = response.headers.get('content-type', '').lower()
-            if 'pdf' in content_type or 'application/octet-stream' in content_type:
-                return response.content
-            elif 'word' in content_type or 'document' in content_type:
-                return response.content
-            else:
-                # Try to determine from URL
-                if any(ext in url.lower() for ext in self.supported_extensions):
-                    return response.content
-                else:
+            async with client.stream("GET", url, headers=headers) as response:
+                if response.status_code == 304:
+                    return DownloadResult(
+                        content=b"",
+                        content_hash="",
+                        etag=response.headers.get('etag', etag),
+                        last_modified=response.headers.get('last-modified', last_modified),
+                        not_modified=True
+                    )
+                response.raise_for_status()
+                
+                # Check content type
+                content_type = response.headers.get('content-type', '').lower()
+                if not self._is_supported_content(url, content_type):
                     raise Exception(f"Unsupported content type: {content_type}")
+                
+                # Reject early when the server declares an oversized body
+                declared_size = response.headers.get('content-length')
+                if declared_size and declared_size.isdigit() and int(declared_size) > settings.max_document_size:
+                    raise Exception(f"Document size {declared_size} bytes exceeds limit of {settings.max_document_size} bytes")
+                
+                # Stream the body, hashing as we go and aborting as soon as the limit is crossed
+                content = bytearray()
+                hasher = hashlib.sha256()
+                async for part in response.aiter_bytes(settings.download_chunk_size):
+                    content.extend(part)
+                    hasher.update(part)
+                    if len(content) > settings.max_document_size:
+                        raise Exception(f"Document exceeds size limit of {settings.max_document_size} bytes")
+                
+                return DownloadResult(
+                    content=bytes(content),
+                    content_hash=hasher.hexdigest(),
+                    etag=response.headers.get('etag'),
+                    last_modified=response.headers.get('last-modified')
+                )
                     
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             raise Exception(f"Failed to download document: {str(e)}")
         except Exception as e:
             raise Exception(f"Failed to download document: {str(e)}")
     
+    def _is_supported_content(self, url: str, content_type: str) -> bool:
+        """Check whether the response looks like a PDF or Word document"""
+        if 'pdf' in content_type or 'application/octet-stream' in content_type:
+            return True
+        if 'word' in content_type or 'document' in content_type:
+            return True
+        # Try to determine from URL
+        return any(ext in url.lower() for ext in self.supported_extensions)
+    
+    def extract_pages_from_pdf(self, content: bytes) -> List[str]:
+        """Extract the text of each PDF page, serially"""
+        pdf_reader = PyPDF2.PdfReader(io.BytesIO(content))
+        return [page.extract_text() or "" for page in pdf_reader.pages]
+    
     def extract_text_from_pdf(self, content: bytes) -> str:
         """Extract text from PDF content"""
         try:
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(content))
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-            return text
+            return "\n".join(self.extract_pages_from_pdf(content))
+        except Exception as e:
+            raise Exception(f"Failed to extract text from PDF: {str(e)}")
+    
+    async def iter_pdf_pages(self, content: bytes) -> AsyncIterator[str]:
+        """Yield PDF page texts in page order as soon as each page range is extracted"""
+        try:
+            with timed("pdf_extract"):
+                page_count = await asyncio.to_thread(_count_pdf_pages, content)
+            workers = _pdf_worker_count()
+            per_task = max(1, settings.pdf_pages_per_task)
+            
+            if workers <= 1 or page_count <= per_task:
+                # Parse once, then extract range by range on a worker thread
+                with timed("pdf_extract"):
+                    pdf_reader = await asyncio.to_thread(PyPDF2.PdfReader, io.BytesIO(content))
+                for start in range(0, page_count, per_task):
+                    end = min(start + per_task, page_count)
+                    with timed("pdf_extract"):
+                        pages = await asyncio.to_thread(
+                            lambda start=start, end=end: [pdf_reader.pages[i].extract_text() or "" for i in range(start, end)]
+                        )
+                    for page in pages:
+                        yield page
+                return
+            
+            # One contiguous range per worker, so the bytes are shipped to each worker only once
+            tasks = min(workers, math.ceil(page_count / per_task))
+            step = math.ceil(page_count / tasks)
+            loop = asyncio.get_running_loop()
+            pool = _get_pdf_pool()
+            futures = [
+                loop.run_in_executor(pool, _extract_pdf_page_range, content, start, min(start + step, page_count))
+                for start in range(0, page_count, step)
+            ]
+            try:
+                for future in futures:
+                    with timed("pdf_extract"):
+                        pages = await future
+                    for page in pages:
+                        yield page
+            finally:
+                for future in futures:
+                    future.cancel()
         except Exception as e:
             raise Exception(f"Failed to extract text from PDF: {str(e)}")
     
+    async def extract_pdf_pages(self, content: bytes) -> List[str]:
+        """Extract PDF page texts in page order without blocking the event loop"""
+        return [page async for page in self.iter_pdf_pages(content)]
+    
     def extract_text_from_docx(self, content: bytes) -> str:
         """Extract text from DOCX content"""
         try:
             doc = Document(io.BytesIO(content))
-            text = ""
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-            return text
+            return "\n".join(paragraph.text for paragraph in doc.paragraphs)
         except Exception as e:
             raise Exception(f"Failed to extract text from DOCX: {str(e)}")
     
@@ -62,83 +220,90 @@ class DocumentProcessor:
         """Clean and normalize text"""
         if not text or text.strip() == "":
             raise Exception("No text content found in document")
-            
-        # Remove extra whitespace
-        text = re.sub(r'\s+', ' ', text)
+        return self._normalize_text(text)
+    
+    def _normalize_text(self, text: str) -> str:
         # Remove special characters but keep important punctuation
         text = re.sub(r'[^\w\s\.\,\;\:\!\?\-\(\)\[\]\{\}]', '', text)
+        # Collapse whitespace within lines; keep line breaks so headings can be detected
+        text = re.sub(r'[^\S\n]+', ' ', text)
+        text = re.sub(r' ?\n ?', '\n', text)
+        text = re.sub(r'\n{3,}', '\n\n', text)
         return text.strip()
     
     def chunk_text(self, text: str) -> List[DocumentChunk]:
         """Split text into chunks for processing"""
-        if not text or len(text.strip()) == 0:
+        return self.chunk_pages([text])
+    
+    def chunk_pages(self, pages: List[str]) -> List[DocumentChunk]:
+        """Split page texts into chunks, recording the page span of each chunk"""
+        if not any(page.strip() for page in pages):
             raise Exception("No text content available for chunking")
-            
-        chunks = []
-        words = text.split()
-        current_chunk = []
-        current_length = 0
-        
-        for word in words:
-            if current_length + len(word) + 1 > settings.chunk_size:
-                if current_chunk:
-                    chunk_text = " ".join(current_chunk)
-                    chunks.append(DocumentChunk(
-                        content=chunk_text,
-                        metadata={
-                            "chunk_id": len(chunks),
-                            "word_count": len(current_chunk),
-                            "char_count": len(chunk_text)
-                        }
-                    ))
-                current_chunk = [word]
-                current_length = len(word)
-            else:
-                current_chunk.append(word)
-                current_length += len(word) + 1
         
-        # Add the last chunk
-        if current_chunk:
-            chunk_text = " ".join(current_chunk)
-            chunks.append(DocumentChunk(
-                content=chunk_text,
-                metadata={
-                    "chunk_id": len(chunks),
-                    "word_count": len(current_chunk),
-                    "char_count": len(chunk_text)
-                }
-            ))
+        chunker = StructuredChunker()
+        chunks = []
+        for page_number, page in enumerate(pages, 1):
+            chunks.extend(chunker.feed(page_number, page))
+        chunks.extend(chunker.flush())
         
         if not chunks:
             raise Exception("No valid chunks created from document")
             
         return chunks
     
+    def _detect_format(self, url: str, content: bytes) -> str:
+        """Return "pdf" or "docx" based on the URL, falling back to the content"""
+        if url.lower().endswith('.pdf') or 'pdf' in url.lower():
+            return "pdf"
+        if url.lower().endswith(('.docx', '.doc')) or 'word' in url.lower():
+            return "docx"
+        # Try to detect from content
+        if content.startswith(b'%PDF'):
+            return "pdf"
+        raise Exception("Unsupported document format. Please provide a PDF or DOCX file.")
+    
+    async def iter_chunk_batches(self, url: str, content: bytes, batch_size: int) -> AsyncIterator[List[DocumentChunk]]:
+        """Stream pages through cleaning and chunking, yielding chunk batches as they fill.
+        
+        Only the current page and the unflushed chunk tail are held at a
+        time, never the full extracted or cleaned text.
+        """
+        if self._detect_format(url, content) == "pdf":
+            pages = self.iter_pdf_pages(content)
+        else:
+            pages = _single_page(asyncio.to_thread(self.extract_text_from_docx, content), "docx_extract")
+        del content
+        
+        chunker = StructuredChunker()
+        batch: List[DocumentChunk] = []
+        page_number = 0
+        async for page in pages:
+            page_number += 1
+            with timed("chunk"):
+                batch.extend(chunker.feed(page_number, self._normalize_text(page)))
+            while len(batch) >= batch_size:
+                yield batch[:batch_size]
+                batch = batch[batch_size:]
+        batch.extend(chunker.flush())
+        
+        if chunker.chunk_count == 0:
+            raise Exception("No text content found in document")
+        if batch:
+            yield batch
+    
+    async def parse_document(self, url: str, content: bytes) -> List[DocumentChunk]:
+        """Extract, clean and chunk downloaded document content off the event loop"""
+        chunks = []
+        async for batch in self.iter_chunk_batches(url, content, settings.ingest_batch_size):
+            chunks.extend(batch)
+        return chunks
+    
     async def process_document(self, url: str) -> List[DocumentChunk]:
         """Process document from URL and return chunks"""
         try:
             # Download document
             content = await self.download_document(url)
-            
-            # Determine file type and extract text
-            if url.lower().endswith('.pdf') or 'pdf' in url.lower():
-                text = self.extract_text_from_pdf(content)
-            elif url.lower().endswith(('.docx', '.doc')) or 'word' in url.lower():
-                text = self.extract_text_from_docx(content)
-            else:
-                # Try to detect from content
-                if content.startswith(b'%PDF'):
-                    text = self.extract_text_from_pdf(content)
-                else:
-                    raise Exception("Unsupported document format. Please provide a PDF or DOCX file.")
-            
-            # Clean text
-            text = self.clean_text(text)
-            
-            # Chunk text
-            chunks = self.chunk_text(text)
-            
-            return chunks
+            return await self.parse_document(url, content)
             
         except Exception as e:
-            raise Exception(f"Document processing failed: {str(e)}") 
\ No newline at end of file
+            raise Exception(f"Document processing failed: {str(e)}")
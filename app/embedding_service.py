@@ -0,0 +1,210 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import List, Dict, Optional
+import numpy as np
+import openai
+from app.llm_scheduler import is_retryable_error, retry_after_seconds, backoff_delay
+from app.metrics import record_cache, timed
+from config import settings
+
+class EmbeddingCache:
+    """Persistent embedding cache keyed by (model, SHA-256 of text).
+
+    Vectors are stored as float32 blobs in a local SQLite database so they
+    survive restarts and are shared by every chunk or question with the same
+    text.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.path.join(settings.cache_dir, "embeddings.sqlite3")
+        self._lock = threading.Lock()
+        self._conn = None
+        self.stats = {"hits": 0, "misses": 0, "writes": 0}
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, text_hash))"
+            )
+            self._conn.commit()
+        except Exception as e:
+            print(f"Warning: Embedding cache unavailable: {e}")
+            self._conn = None
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, np.ndarray]:
+        """Look up vectors for the given text hashes"""
+        found = {}
+        if self._conn is None or not hashes:
+            self.stats["misses"] += len(hashes)
+            return found
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch]
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = np.frombuffer(blob, dtype=np.float32)
+        self.stats["hits"] += len(found)
+        self.stats["misses"] += len(hashes) - len(found)
+        return found
+
+    def put_many(self, model: str, items: Dict[str, np.ndarray]):
+        """Store vectors keyed by text hash"""
+        if self._conn is None or not items:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                [(model, text_hash, np.asarray(vector, dtype=np.float32).tobytes())
+                 for text_hash, vector in items.items()]
+            )
+            self._conn.commit()
+        self.stats["writes"] += len(items)
+
+class EmbeddingService:
+    """Batched, concurrent embedding client backed by EmbeddingCache.
+
+    Inputs are deduplicated, served from the cache where possible, and the
+    remainder is sent in batches of settings.embedding_batch_size with at
+    most settings.embedding_max_concurrency requests in flight. Transient
+    failures (429, 5xx, connection errors) are retried with jittered
+    exponential backoff.
+
+    With settings.embedding_provider = "sentence-transformers" the vectors
+    come from a local model instead of the OpenAI API.
+    """
+
+    def __init__(self):
+        self.provider = settings.embedding_provider
+        if self.provider == "sentence-transformers":
+            self.model = settings.local_embedding_model
+        else:
+            self.model = settings.embedding_model
+        self.cache = EmbeddingCache() if settings.embedding_cache_enabled else None
+        self._client = None
+        self._local_model = None
+        self._semaphore = None
+        self.stats = {"requests": 0, "retries": 0, "texts_embedded": 0}
+
+    def _get_client(self) -> openai.AsyncOpenAI:
+        """Create the pooled async OpenAI client on first use"""
+        if self._client is None:
+            if not settings.openai_api_key:
+                raise Exception("OpenAI API key not provided")
+            import httpx
+            self._client = openai.AsyncOpenAI(
+                api_key=settings.openai_api_key,
+                base_url=settings.openai_base_url,
+                max_retries=0,  # Retries are handled here with backoff
+                http_client=httpx.AsyncClient(
+                    limits=httpx.Limits(max_connections=settings.embedding_max_concurrency * 2)
+                )
+            )
+        return self._client
+
+    def _get_local_model(self):
+        """Load the sentence-transformers model on first use"""
+        if self._local_model is None:
+            from sentence_transformers import SentenceTransformer
+            self._local_model = SentenceTransformer(self.model)
+            print(f"✅ Loaded local embedding model: {self.model}")
+        return self._local_model
+
+    def is_available(self) -> bool:
+        """Whether embeddings can be produced with the current configuration"""
+        if self.provider == "sentence-transformers":
+            try:
+                import sentence_transformers  # noqa: F401
+                return True
+            except ImportError:
+                return False
+        return bool(settings.openai_api_key)
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(settings.embedding_max_concurrency)
+        return self._semaphore
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed texts, returning a float32 matrix with one row per input"""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        hashes = [EmbeddingCache.text_hash(text) for text in texts]
+        unique: Dict[str, str] = {}
+        for text_hash, text in zip(hashes, texts):
+            unique.setdefault(text_hash, text)
+
+        vectors: Dict[str, np.ndarray] = {}
+        if self.cache is not None:
+            vectors = await asyncio.to_thread(self.cache.get_many, self.model, list(unique))
+
+        missing = [text_hash for text_hash in unique if text_hash not in vectors]
+        if self.cache is not None:
+            record_cache("embedding", len(unique) - len(missing), len(missing))
+        if missing:
+            batch_size = settings.embedding_batch_size
+            batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+            with timed("embedding"):
+                results = await asyncio.gather(
+                    *[self._embed_batch([unique[text_hash] for text_hash in batch]) for batch in batches]
+                )
+            fresh = {}
+            for batch, batch_vectors in zip(batches, results):
+                for text_hash, vector in zip(batch, batch_vectors):
+                    fresh[text_hash] = vector
+            vectors.update(fresh)
+            if self.cache is not None:
+                await asyncio.to_thread(self.cache.put_many, self.model, fresh)
+
+        return np.vstack([vectors[text_hash] for text_hash in hashes]).astype(np.float32, copy=False)
+
+    async def _embed_batch(self, texts: List[str]) -> List[np.ndarray]:
+        """Embed one batch, retrying transient API failures"""
+        if self.provider == "sentence-transformers":
+            model = await asyncio.to_thread(self._get_local_model)
+            async with self._get_semaphore():
+                matrix = await asyncio.to_thread(
+                    model.encode, texts, batch_size=settings.embedding_batch_size, convert_to_numpy=True
+                )
+            self.stats["texts_embedded"] += len(texts)
+            return list(np.asarray(matrix, dtype=np.float32))
+
+        client = self._get_client()
+        attempt = 0
+        async with self._get_semaphore():
+            while True:
+                try:
+                    self.stats["requests"] += 1
+                    response = await client.embeddings.create(model=self.model, input=texts)
+                    self.stats["texts_embedded"] += len(texts)
+                    ordered = sorted(response.data, key=lambda item: item.index)
+                    return [np.asarray(item.embedding, dtype=np.float32) for item in ordered]
+                except Exception as e:
+                    if attempt >= settings.embedding_max_retries or not is_retryable_error(e):
+                        raise
+                    attempt += 1
+                    self.stats["retries"] += 1
+                    delay = retry_after_seconds(e) or backoff_delay(attempt)
+                    print(f"Embedding request failed ({e}), retrying in {delay:.2f}s")
+                    await asyncio.sleep(delay)
+
+    def get_stats(self) -> Dict[str, int]:
+        stats = dict(self.stats)
+        if self.cache is not None:
+            stats.update({f"cache_{key}": value for key, value in self.cache.stats.items()})
+        return stats
@@ -0,0 +1,103 @@
+import math
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Set
+from app.chunker import segment_page
+from app.fallback_search import tokenize
+from app.models import SearchResult
+from config import settings
+
+# Questions asking for a duration, amount or limit need a number in the answer
+QUANTITY_QUESTION = re.compile(
+    r"\b(how (long|many|much|often)|period|percent(age)?|limit|days?|months?|years?|age|amount|discount|sub-limits?)\b",
+    re.IGNORECASE
+)
+# Policies often spell quantities out ("thirty days", "two years")
+NUMBER_PATTERN = re.compile(
+    r"\d|\b(one|two|three|four|five|six|seven|eight|nine|ten|eleven|twelve|thirteen|fourteen|fifteen|sixteen"
+    r"|seventeen|eighteen|nineteen|twenty|thirty|forty|fifty|sixty|seventy|eighty|ninety|hundred|thousand"
+    r"|lakhs?|crores?|million)\b",
+    re.IGNORECASE
+)
+# Yes/no questions want a verdict with its conditions, which a quoted sentence does not give
+YES_NO_QUESTION = re.compile(
+    r"^\s*(is|are|was|were|does|do|did|can|could|will|would|shall|should|may|has|have|had)\b",
+    re.IGNORECASE
+)
+VERB_SUFFIXES = ("ing", "ed")
+
+@dataclass
+class ExtractiveAnswer:
+    """A sentence taken verbatim from a retrieved chunk, with the scorer's confidence"""
+    text: str
+    confidence: float
+    chunk_rank: int
+
+def _terms(text: str) -> Set[str]:
+    """Search terms with -ed/-ing also folded, so 'covered' matches 'cover'"""
+    terms = set()
+    for token in tokenize(text):
+        for suffix in VERB_SUFFIXES:
+            if token.endswith(suffix) and len(token) - len(suffix) >= 4:
+                token = token[:-len(suffix)]
+                break
+        terms.add(token)
+    return terms
+
+def _candidate_sentences(results: List[SearchResult], max_chunks: int):
+    """(sentence, chunk rank) for the sentences of the best max_chunks chunks, without repeats"""
+    ranked = sorted(results, key=lambda result: result.score, reverse=True)[:max_chunks]
+    seen = set()
+    for rank, result in enumerate(ranked):
+        for start, end, heading in segment_page(result.content):
+            sentence = " ".join(result.content[start:end].split())
+            words = len(sentence.split())
+            if heading or sentence in seen or not settings.extractive_min_words <= words <= settings.extractive_max_words:
+                continue
+            seen.add(sentence)
+            yield sentence, rank
+
+def extract_answer(question: str, results: List[SearchResult]) -> Optional[ExtractiveAnswer]:
+    """Best answering sentence for question among the top retrieved chunks, or None.
+
+    Each sentence is scored by the IDF-weighted share of the question's terms
+    it contains (IDF over the candidate sentences, so words that appear
+    everywhere count little), halved when the question asks for a quantity
+    and the sentence has no number (digits or spelled out), and discounted
+    slightly outside the top chunk. Confidence is the best score minus the
+    runner-up's, so two sentences that match equally well (e.g. different
+    waiting periods) leave it to the LLM. Yes/no questions are never
+    extracted.
+    """
+    terms = _terms(question)
+    if len(terms) < 2 or YES_NO_QUESTION.match(question):
+        return None
+    candidates = list(_candidate_sentences(results, settings.extractive_max_chunks))
+    if not candidates:
+        return None
+
+    sentence_terms = [_terms(sentence) for sentence, _ in candidates]
+    count = len(candidates)
+    weights = {term: math.log(1 + count / (1 + sum(1 for found in sentence_terms if term in found))) for term in terms}
+    total = sum(weights.values())
+    wants_number = bool(QUANTITY_QUESTION.search(question))
+
+    scored = []
+    for (sentence, rank), found in zip(candidates, sentence_terms):
+        score = sum(weights[term] for term in terms & found) / total
+        if wants_number and not NUMBER_PATTERN.search(sentence):
+            score *= 0.5
+        score *= 1.0 - 0.1 * rank
+        scored.append((score, sentence, rank))
+    scored.sort(key=lambda item: item[0], reverse=True)
+
+    best, sentence, rank = scored[0]
+    runner_up = scored[1][0] if len(scored) > 1 else 0.0
+    return ExtractiveAnswer(text=sentence, confidence=best - runner_up, chunk_rank=rank)
+
+def confident_answer(question: str, results: List[SearchResult]) -> Optional[str]:
+    """The extracted sentence if its confidence clears settings.extractive_threshold"""
+    answer = extract_answer(question, results)
+    if answer is None or answer.confidence < settings.extractive_threshold:
+        return None
+    return answer.text
@@ -1,90 +1,159 @@
+import json
+import os
 import re
-from typing import List
+from collections import Counter
+from typing import List, Dict, Optional
+import numpy as np
 from app.models import DocumentChunk, SearchResult
 
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset({
+    "a", "an", "and", "are", "as", "at", "be", "by", "does", "do", "for", "from",
+    "how", "if", "in", "is", "it", "of", "on", "or", "that", "the", "this", "to",
+    "under", "what", "when", "which", "with", "will", "there", "any", "can", "i"
+})
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric tokens with stopwords removed and plurals folded"""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
 class FallbackSearch:
-    def __init__(self):
-        self.documents = []
-    
+    """BM25 lexical search over an inverted index.
+
+    Documents are tokenized once in add_documents. Postings are stored in
+    CSR form: posting_offsets[t]:posting_offsets[t + 1] slices posting_docs
+    and posting_weights for term t, where the weight is the document-length
+    normalized BM25 term-frequency factor. A query only touches the postings
+    of its own terms.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.documents: List[DocumentChunk] = []
+        self.vocabulary: Dict[str, int] = {}
+        self.idf = np.zeros(0, dtype=np.float32)
+        self.doc_lengths = np.zeros(0, dtype=np.int32)
+        self.posting_offsets = np.zeros(1, dtype=np.int64)
+        self.posting_docs = np.zeros(0, dtype=np.int32)
+        self.posting_weights = np.zeros(0, dtype=np.float32)
+
     def add_documents(self, chunks: List[DocumentChunk]):
-        """Add document chunks to the search index"""
-        self.documents = chunks
-    
+        """Build the inverted index for the given chunks (replacing any previous ones)"""
+        self.documents = list(chunks)
+        term_docs: Dict[str, List[int]] = {}
+        term_freqs: Dict[str, List[int]] = {}
+        doc_lengths = np.zeros(len(self.documents), dtype=np.int32)
+
+        for doc_id, chunk in enumerate(self.documents):
+            tokens = tokenize(chunk.content)
+            doc_lengths[doc_id] = len(tokens)
+            for term, freq in Counter(tokens).items():
+                term_docs.setdefault(term, []).append(doc_id)
+                term_freqs.setdefault(term, []).append(freq)
+
+        terms = sorted(term_docs)
+        self.vocabulary = {term: term_id for term_id, term in enumerate(terms)}
+        self.doc_lengths = doc_lengths
+
+        counts = np.array([len(term_docs[term]) for term in terms], dtype=np.int64)
+        self.posting_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.posting_offsets[1:])
+        if terms:
+            self.posting_docs = np.concatenate([np.asarray(term_docs[t], dtype=np.int32) for t in terms])
+            freqs = np.concatenate([np.asarray(term_freqs[t], dtype=np.float32) for t in terms])
+        else:
+            self.posting_docs = np.zeros(0, dtype=np.int32)
+            freqs = np.zeros(0, dtype=np.float32)
+
+        # Precompute the BM25 tf component per posting
+        n_docs = max(len(self.documents), 1)
+        avg_length = float(doc_lengths.mean()) if len(doc_lengths) and doc_lengths.mean() > 0 else 1.0
+        length_norm = self.k1 * (1 - self.b + self.b * doc_lengths[self.posting_docs] / avg_length)
+        self.posting_weights = (freqs * (self.k1 + 1) / (freqs + length_norm)).astype(np.float32)
+        self.idf = np.log(1 + (n_docs - counts + 0.5) / (counts + 0.5)).astype(np.float32)
+
     def search(self, query: str, top_k: int = 5) -> List[SearchResult]:
-        """Search for relevant content using simple text matching"""
+        """Return the top_k chunks by BM25 score"""
         if not self.documents:
             return []
-        
-        # Convert query to lowercase for better matching
-        query_lower = query.lower()
-        
-        # Define search terms for common insurance queries
-        search_terms = {
-            'grace period': ['grace period', 'grace', 'payment grace', 'thirty days', '30 days'],
-            'premium payment': ['premium payment', 'premium', 'payment'],
-            'waiting period': ['waiting period', 'waiting', 'period'],
-            'maternity': ['maternity', 'pregnancy', 'delivery'],
-            'hospital': ['hospital', 'hospitalization'],
-            'coverage': ['coverage', 'cover', 'benefit'],
-            'exclusion': ['exclusion', 'exclude', 'not covered'],
-            'claim': ['claim', 'claiming', 'claimant'],
-            'renewal': ['renewal', 'renew', 'continue'],
-            'policy': ['policy', 'insurance', 'mediclaim']
-        }
-        
-        # Find relevant search terms
-        relevant_terms = []
-        for category, terms in search_terms.items():
-            if any(term in query_lower for term in terms):
-                relevant_terms.extend(terms)
-        
-        # If no specific terms found, use the original query
-        if not relevant_terms:
-            relevant_terms = [query_lower]
-        
-        # Score each document chunk
-        scored_chunks = []
-        for chunk in self.documents:
-            content_lower = chunk.content.lower()
-            score = 0
-            
-            # Calculate score based on term frequency and relevance
-            for term in relevant_terms:
-                if term in content_lower:
-                    # Count occurrences
-                    count = content_lower.count(term)
-                    score += count * 0.5
-                    
-                    # Bonus for exact phrase matches
-                    if term in query_lower and term in content_lower:
-                        score += 2.0
-                    
-                    # Bonus for proximity to important words
-                    if any(word in content_lower for word in ['grace', 'period', 'premium', 'payment']):
-                        score += 1.0
-                    
-                    # Special bonus for grace period specific terms
-                    if 'grace period' in content_lower and 'grace period' in query_lower:
-                        score += 5.0
-                    
-                    # Bonus for exact definitions
-                    if 'means' in content_lower and any(term in content_lower for term in ['grace', 'period']):
-                        score += 3.0
-            
-            if score > 0:
-                scored_chunks.append((chunk, score))
-        
-        # Sort by score and return top results
-        scored_chunks.sort(key=lambda x: x[1], reverse=True)
-        
+
+        term_ids = {self.vocabulary[t] for t in tokenize(query) if t in self.vocabulary}
+        if not term_ids:
+            return []
+
+        # Gather only the postings of the query terms
+        docs, contributions = [], []
+        for term_id in term_ids:
+            start, end = self.posting_offsets[term_id], self.posting_offsets[term_id + 1]
+            docs.append(self.posting_docs[start:end])
+            contributions.append(self.posting_weights[start:end] * self.idf[term_id])
+        docs = np.concatenate(docs)
+        contributions = np.concatenate(contributions)
+
+        matched, inverse = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=contributions).astype(np.float32)
+
+        k = min(top_k, len(matched))
+        if k < len(matched):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(matched))
+        top = top[np.argsort(-scores[top])]
+
         results = []
-        for chunk, score in scored_chunks[:top_k]:
-            # Normalize score to 0-1 range
-            normalized_score = min(score / 10.0, 1.0)
+        for position in top:
+            chunk = self.documents[matched[position]]
             results.append(SearchResult(
                 content=chunk.content,
-                score=normalized_score,
+                score=float(scores[position]),
                 metadata=chunk.metadata
             ))
-        
-        return results 
\ No newline at end of file
+        return results
+
+    def save(self, path: str):
+        """Persist the index as a single .npz file"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            params=np.array([self.k1, self.b], dtype=np.float32),
+            terms=np.array(terms, dtype=str),
+            idf=self.idf,
+            doc_lengths=self.doc_lengths,
+            posting_offsets=self.posting_offsets,
+            posting_docs=self.posting_docs,
+            posting_weights=self.posting_weights,
+            documents=np.array(json.dumps([chunk.model_dump() for chunk in self.documents]))
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["FallbackSearch"]:
+        """Load an index written by save(), or None if it is missing or unreadable"""
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                k1, b = (float(value) for value in data["params"])
+                index = cls(k1=k1, b=b)
+                index.vocabulary = {str(term): term_id for term_id, term in enumerate(data["terms"])}
+                index.idf = data["idf"]
+                index.doc_lengths = data["doc_lengths"]
+                index.posting_offsets = data["posting_offsets"]
+                index.posting_docs = data["posting_docs"]
+                index.posting_weights = data["posting_weights"]
+                index.documents = [DocumentChunk(**chunk) for chunk in json.loads(str(data["documents"]))]
+            return index
+        except Exception as e:
+            print(f"Warning: Failed to load lexical index {path}: {e}")
+            return None
@@ -0,0 +1,27 @@
+import httpx
+from typing import Optional
+from config import settings
+
+# Shared pooled client, created lazily on first use
+_http_client: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared async HTTP client (connection pooled)"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.download_timeout, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=settings.http_max_connections,
+                max_keepalive_connections=settings.http_max_keepalive_connections
+            ),
+            follow_redirects=True
+        )
+    return _http_client
+
+async def close_http_client():
+    """Close the shared HTTP client and release pooled connections"""
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
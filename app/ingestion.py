@@ -0,0 +1,114 @@
+import asyncio
+import contextvars
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from app.models import DocumentChunk, IngestJob
+from config import settings
+
+class IngestionQueue:
+    """Background document ingestion.
+
+    submit() enqueues a document URL and returns a job right away; a pool of
+    worker tasks runs each job through prepare (QueryEngine.prepare_document).
+    prepare is single-flight per URL and backed by the document cache, so a
+    /hackrx/run request for a URL that is being ingested joins the running
+    job, and one for an ingested URL reuses its result. A URL that already has
+    a queued or running job gets that job back instead of a new one.
+    """
+
+    def __init__(self, prepare: Callable[[str], Awaitable[Tuple[str, List[DocumentChunk]]]]):
+        self.prepare = prepare
+        self.worker_count = settings.ingest_workers
+        self.max_jobs = settings.ingest_max_jobs
+        self.jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._active_by_url: Dict[str, str] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self.stats = {"submitted": 0, "deduplicated": 0, "completed": 0, "failed": 0}
+
+    def start(self):
+        """Start the worker tasks (done lazily on the first submit)"""
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=settings.ingest_queue_size)
+        # Workers outlive the request that started them, so they must not inherit its context
+        self._workers = [
+            asyncio.create_task(self._work(), context=contextvars.Context()) for _ in range(self.worker_count)
+        ]
+        print(f"✅ Started {self.worker_count} ingestion workers")
+
+    async def stop(self):
+        """Cancel the workers; queued jobs are dropped"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, url: str) -> IngestJob:
+        """Enqueue a document URL, or return its queued or running job"""
+        self.start()
+        job_id = self._active_by_url.get(url)
+        if job_id is not None:
+            self.stats["deduplicated"] += 1
+            return self.jobs[job_id]
+
+        job = IngestJob(job_id=uuid.uuid4().hex, url=url, status="queued", created_at=time.time())
+        try:
+            self._queue.put_nowait(job.job_id)
+        except asyncio.QueueFull:
+            raise Exception("Ingestion queue is full, try again later")
+        self.jobs[job.job_id] = job
+        self._active_by_url[url] = job.job_id
+        self.stats["submitted"] += 1
+        self._evict_finished()
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        return self.jobs.get(job_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "workers": len(self._workers),
+            "queued": self._queue.qsize() if self._queue else 0,
+            "jobs": len(self.jobs)
+        }
+
+    async def _work(self):
+        while True:
+            job_id = await self._queue.get()
+            job = self.jobs.get(job_id)
+            try:
+                if job is not None:
+                    await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: IngestJob):
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            content_hash, chunks = await self.prepare(job.url)
+            job.content_hash = content_hash
+            job.chunks = len(chunks)
+            job.status = "completed"
+            self.stats["completed"] += 1
+        except Exception as e:
+            print(f"❌ Ingestion failed for {job.url}: {e}")
+            job.error = str(e)
+            job.status = "failed"
+            self.stats["failed"] += 1
+        finally:
+            job.finished_at = time.time()
+            if self._active_by_url.get(job.url) == job.job_id:
+                del self._active_by_url[job.url]
+
+    def _evict_finished(self):
+        """Forget the oldest finished jobs beyond max_jobs"""
+        excess = len(self.jobs) - self.max_jobs
+        if excess <= 0:
+            return
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.finished_at is not None][:excess]:
+            del self.jobs[job_id]
@@ -1,22 +1,65 @@
 import openai
-from typing import List, Optional
+import json
+from typing import Callable, List, Optional
+from app.llm_scheduler import ProviderScheduler
+from app.provider_router import ProviderRouter
+from app.metrics import LLM_TOKENS
+from app.context_builder import build_context
+from app.models import SearchResult
 from config import settings
 import asyncio
 
+SYSTEM_PROMPT = "You are a helpful assistant. Answer questions accurately and concisely."
+
+# Bump whenever a prompt template changes so cached answers are not reused
+PROMPT_VERSION = "3"
+
+LLM_UNAVAILABLE_MESSAGE = "LLM service not available. Please check configuration."
+
+# Ask streamed completions for a final usage chunk; sent as a raw body field
+# because the pinned client versions do not know the stream_options parameter
+STREAM_USAGE = {"stream_options": {"include_usage": True}}
+
+def is_error_answer(answer: str) -> bool:
+    """Whether an answer string reports a failure rather than an actual answer"""
+    return answer == LLM_UNAVAILABLE_MESSAGE or answer.startswith(("Error generating answer", "Error processing request", "Error:"))
+
 class LLMProcessor:
     def __init__(self):
         self.client = None
         self.groq_client = None
+        self.schedulers = {
+            "groq": ProviderScheduler(
+                "Groq",
+                max_concurrency=settings.groq_max_concurrency,
+                rpm=settings.groq_rpm,
+                tpm=settings.groq_tpm,
+                max_retries=settings.llm_max_retries
+            ),
+            "openai": ProviderScheduler(
+                "OpenAI",
+                max_concurrency=settings.openai_max_concurrency,
+                rpm=settings.openai_rpm,
+                tpm=settings.openai_tpm,
+                max_retries=settings.llm_max_retries
+            )
+        }
+        self.router = ProviderRouter(list(self.schedulers))
         self.initialize_client()
     
     def initialize_client(self):
-        """Initialize OpenAI and Groq clients"""
+        """Initialize async OpenAI and Groq clients"""
         try:
             # Try Groq first (faster)
             if settings.groq_api_key:
                 try:
                     import groq
-                    self.groq_client = groq.Groq(api_key=settings.groq_api_key)
+                    # Retries are handled by the provider scheduler
+                    self.groq_client = groq.AsyncGroq(
+                        api_key=settings.groq_api_key,
+                        base_url=settings.groq_base_url,
+                        max_retries=0
+                    )
                     print("✅ Groq client initialized successfully (Primary)")
                 except Exception as e:
                     print(f"Groq initialization failed: {e}")
@@ -26,10 +69,14 @@ class LLMProcessor:
             if settings.openai_api_key:
                 try:
                     import httpx
-                    http_client = httpx.Client()
-                    self.client = openai.OpenAI(
+                    http_client = httpx.AsyncClient(
+                        limits=httpx.Limits(max_connections=settings.openai_max_concurrency * 2)
+                    )
+                    self.client = openai.AsyncOpenAI(
                         api_key=settings.openai_api_key,
-                        http_client=http_client
+                        base_url=settings.openai_base_url,
+                        http_client=http_client,
+                        max_retries=0
                     )
                     print("✅ OpenAI client initialized successfully (Fallback)")
                 except Exception as e:
@@ -38,72 +85,190 @@ class LLMProcessor:
             
             if not self.client and not self.groq_client:
                 print("Warning: No LLM service available")
-                
+        
         except Exception as e:
             print(f"Warning: LLM client initialization failed: {e}")
             self.client = None
             self.groq_client = None
     
-    async def generate_answer(self, question: str, context: str) -> str:
-        """Generate answer using LLM with optimized prompt"""
+    def model_signature(self) -> str:
+        """Identifies the models and sampling settings that produce answers"""
+        parts = []
+        if self.groq_client:
+            parts.append(f"groq:{settings.groq_model}:{settings.groq_max_tokens}")
+        if self.client:
+            parts.append(f"openai:{settings.llm_model}:{settings.max_tokens}:{settings.temperature}")
+        return "|".join(parts) or "none"
+    
+    def context_budget(self) -> int:
+        """Context tokens that fit every configured provider, since a prompt may fall back"""
+        budgets = []
+        if self.groq_client:
+            budgets.append(settings.groq_context_tokens)
+        if self.client:
+            budgets.append(settings.openai_context_tokens)
+        return min(budgets) if budgets else settings.openai_context_tokens
+    
+    def build_context(self, results: List[SearchResult], ordered: bool = False) -> str:
+        """Pack retrieved chunks into this processor's context budget"""
+        return build_context(results, self.context_budget(), ordered)
+    
+    def _estimate_tokens(self, prompt: str, max_tokens: int) -> int:
+        """Rough token reservation for TPM limiting (prompt + completion budget)"""
+        return (len(SYSTEM_PROMPT) + len(prompt)) // 4 + max_tokens
+    
+    def _record_usage(self, provider: str, response):
+        """Count the tokens a provider reports for a completion (or the usage chunk of a stream)"""
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            # Groq reports stream usage under x_groq
+            usage = getattr(getattr(response, "x_groq", None), "usage", None)
+        if usage is None:
+            return
+        for kind in ("prompt", "completion"):
+            # Clients that predate stream usage keep it as a plain dict
+            count = usage.get(f"{kind}_tokens") if isinstance(usage, dict) else getattr(usage, f"{kind}_tokens", 0)
+            LLM_TOKENS.inc(count or 0, provider=provider, kind=kind)
+    
+    def _messages(self, prompt: str):
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+    
+    async def _consume_stream(self, provider: str, create_stream, on_token: Callable[[str], None]) -> str:
+        """Read a streamed completion, forwarding each text delta as it arrives and recording usage"""
+        stream = await create_stream
+        parts = []
+        try:
+            async for chunk in stream:
+                self._record_usage(provider, chunk)
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    on_token(delta)
+        except Exception as e:
+            if parts:
+                # Tokens were already delivered, so the call must not be retried
+                raise Exception(f"Stream interrupted: {e}")
+            raise
+        return "".join(parts).strip()
+    
+    async def _complete_groq(self, prompt: str, max_tokens: Optional[int] = None,
+                             on_token: Optional[Callable[[str], None]] = None) -> str:
+        max_tokens = max_tokens or settings.groq_max_tokens
+        create = lambda **extra: self.groq_client.chat.completions.create(
+            model=settings.groq_model,
+            messages=self._messages(prompt),
+            max_tokens=max_tokens,
+            temperature=0.1,
+            **extra
+        )
+        estimated_tokens = self._estimate_tokens(prompt, max_tokens)
+        if on_token is not None:
+            return await self.schedulers["groq"].run(
+                lambda: self._consume_stream("groq", create(stream=True, extra_body=STREAM_USAGE), on_token),
+                estimated_tokens=estimated_tokens
+            )
+        response = await self.schedulers["groq"].run(create, estimated_tokens=estimated_tokens)
+        self._record_usage("groq", response)
+        return response.choices[0].message.content.strip()
+    
+    async def _complete_openai(self, prompt: str, max_tokens: Optional[int] = None,
+                               on_token: Optional[Callable[[str], None]] = None) -> str:
+        max_tokens = max_tokens or settings.max_tokens
+        create = lambda **extra: self.client.chat.completions.create(
+            model=settings.llm_model,
+            messages=self._messages(prompt),
+            max_tokens=max_tokens,
+            temperature=settings.temperature,
+            **extra
+        )
+        estimated_tokens = self._estimate_tokens(prompt, max_tokens)
+        if on_token is not None:
+            return await self.schedulers["openai"].run(
+                lambda: self._consume_stream("openai", create(stream=True, extra_body=STREAM_USAGE), on_token),
+                estimated_tokens=estimated_tokens
+            )
+        response = await self.schedulers["openai"].run(create, estimated_tokens=estimated_tokens)
+        self._record_usage("openai", response)
+        return response.choices[0].message.content.strip()
+    
+    async def complete(self, prompt: str, max_tokens: Optional[int] = None,
+                       on_token: Optional[Callable[[str], None]] = None) -> Optional[str]:
+        """Run a prompt on Groq or OpenAI through the provider router; None if no provider answered.
+        
+        Groq is preferred until latency routing has data on both providers.
+        A call slower than its provider's usual p95 is hedged to the other
+        provider, and failures fall back to it (see ProviderRouter). With
+        on_token the completion is streamed and each text delta is passed to
+        it; streamed calls are not hedged, and once tokens have been
+        delivered there is no fallback.
+        """
+        emitted = []
+        forward = None
+        if on_token is not None:
+            def forward(delta: str):
+                emitted.append(delta)
+                on_token(delta)
+        
+        calls = {}
+        if self.groq_client:
+            calls["groq"] = lambda: self._complete_groq(prompt, max_tokens, forward)
+        if self.client:
+            calls["openai"] = lambda: self._complete_openai(prompt, max_tokens, forward)
+        if not calls:
+            return None
+        
         try:
-            # Create optimized prompt for faster response
+            _, answer = await self.router.run(calls, hedge=on_token is None, fallback_allowed=lambda: not emitted)
+            return answer
+        except Exception as e:
+            print(f"Warning: No LLM provider answered: {e}")
+            if emitted:
+                raise
+            return None
+    
+    async def generate_answer(self, question: str, context: str,
+                              on_token: Optional[Callable[[str], None]] = None) -> str:
+        """Generate answer using LLM with optimized prompt (streamed to on_token if given)"""
+        try:
+            # Context arrives already packed to the token budget (see build_context)
             prompt = f"""Answer this question based on the context. Be concise and accurate.
 
-Context: {context[:1500]}  # Limit context length for speed
+Context:
+{context}
 
 Question: {question}
 
 Answer:"""
             
-            # Try Groq first (faster)
-            if self.groq_client:
-                try:
-                    response = self.groq_client.chat.completions.create(
-                        model="llama3-8b-8192",  # Fast model
-                        messages=[
-                            {"role": "system", "content": "You are a helpful assistant. Answer questions accurately and concisely."},
-                            {"role": "user", "content": prompt}
-                        ],
-                        max_tokens=1000,  # Reduced for speed
-                        temperature=0.1
-                    )
-                    return response.choices[0].message.content.strip()
-                except Exception as e:
-                    print(f"Groq generation failed: {e}")
-            
-            # Try OpenAI as fallback
-            if self.client:
-                try:
-                    response = self.client.chat.completions.create(
-                        model=settings.llm_model,
-                        messages=[
-                            {"role": "system", "content": "You are a helpful assistant. Answer questions accurately and concisely."},
-                            {"role": "user", "content": prompt}
-                        ],
-                        max_tokens=settings.max_tokens,
-                        temperature=settings.temperature
-                    )
-                    return response.choices[0].message.content.strip()
-                except Exception as e:
-                    print(f"OpenAI generation failed: {e}")
-            
-            return "LLM service not available. Please check configuration."
+            answer = await self.complete(prompt, on_token=on_token)
+            if answer is not None:
+                return answer
             
+            return LLM_UNAVAILABLE_MESSAGE
+        
         except Exception as e:
             print(f"Warning: LLM generation failed: {e}")
             return f"Error generating answer: {str(e)}"
     
-    async def generate_answers_batch(self, questions: List[str], contexts: List[str]) -> List[str]:
-        """Generate answers for multiple questions with parallel processing"""
+    async def generate_answers_batch(self, questions: List[str], contexts: List[str],
+                                     on_token: Optional[Callable[[int, str], None]] = None) -> List[str]:
+        """Generate answers for multiple questions concurrently.
+        
+        With on_token, answers are streamed and on_token(i, delta) receives the
+        tokens of question i.
+        """
         try:
             if not self.client and not self.groq_client:
-                return ["LLM service not available. Please check configuration."] * len(questions)
+                return [LLM_UNAVAILABLE_MESSAGE] * len(questions)
             
-            # Process in parallel for speed
+            # All questions run at once; the provider schedulers bound concurrency and rate
             tasks = []
-            for question, context in zip(questions, contexts):
-                task = self.generate_answer(question, context)
+            for i, (question, context) in enumerate(zip(questions, contexts)):
+                forward = (lambda delta, i=i: on_token(i, delta)) if on_token else None
+                task = self.generate_answer(question, context, forward)
                 tasks.append(task)
             
             answers = await asyncio.gather(*tasks, return_exceptions=True)
@@ -117,7 +282,109 @@ Answer:"""
                     processed_answers.append(answer)
             
             return processed_answers
-            
+        
         except Exception as e:
             print(f"Warning: Batch LLM generation failed: {e}")
-            return [f"Error generating answers: {str(e)}"] * len(questions) 
\ No newline at end of file
+            return [f"Error generating answers: {str(e)}"] * len(questions)
+    
+    async def generate_answers_packed(self, questions: List[str],
+                                      results: List[List[SearchResult]]) -> List[str]:
+        """Answer several questions per LLM call.
+        
+        Questions are grouped into packs of llm_pack_max_questions. Each pack
+        shares one deduplicated context built from its questions' retrieved
+        chunks and asks for a JSON array of answers. Answers that are missing
+        or unparseable are retried with a regular per-question call.
+        """
+        if not self.client and not self.groq_client:
+            return [LLM_UNAVAILABLE_MESSAGE] * len(questions)
+        
+        size = max(1, settings.llm_pack_max_questions)
+        packs = [list(range(start, min(start + size, len(questions)))) for start in range(0, len(questions), size)]
+        pack_answers = await asyncio.gather(
+            *[self._answer_pack([questions[i] for i in pack], [results[i] for i in pack]) for pack in packs],
+            return_exceptions=True
+        )
+        
+        answers: List[Optional[str]] = [None] * len(questions)
+        for pack, packed in zip(packs, pack_answers):
+            if isinstance(packed, Exception):
+                print(f"Warning: Packed LLM generation failed: {packed}")
+                continue
+            for i, answer in zip(pack, packed):
+                answers[i] = answer
+        
+        # Fall back to one call per question for anything the packed calls missed
+        missing = [i for i, answer in enumerate(answers) if answer is None]
+        if missing:
+            print(f"⚠️ {len(missing)} packed answers unusable, answering individually")
+            fallback = await self.generate_answers_batch(
+                [questions[i] for i in missing],
+                [self.build_context(results[i]) for i in missing]
+            )
+            for i, answer in zip(missing, fallback):
+                answers[i] = answer
+        
+        return answers
+    
+    async def _answer_pack(self, questions: List[str], results: List[List[SearchResult]]) -> List[Optional[str]]:
+        """Run one multi-question prompt; None marks answers that failed to parse"""
+        # Merge chunks round-robin by rank so every question's best chunk is included first
+        merged = []
+        for rank in range(max((len(r) for r in results), default=0)):
+            for question_results in results:
+                if rank < len(question_results):
+                    merged.append(question_results[rank])
+        # Same token budget, deduplication and overlap trimming as a single-question prompt
+        context = self.build_context(merged, ordered=True)
+        numbered_questions = "\n".join(f"{n}. {question}" for n, question in enumerate(questions, 1))
+        
+        prompt = f"""Answer each question based on the context. Be concise and accurate.
+
+Context:
+{context}
+
+Questions:
+{numbered_questions}
+
+Respond with only a JSON array of {len(questions)} strings, where element i is the answer to question i."""
+        
+        response = await self.complete(prompt, max_tokens=settings.llm_pack_max_tokens)
+        if response is None:
+            return [None] * len(questions)
+        return self._parse_packed_answers(response, len(questions))
+    
+    def _parse_packed_answers(self, response: str, expected: int) -> List[Optional[str]]:
+        """Extract a JSON array of answers from a model response.
+        
+        The first "[" that starts a JSON array of exactly expected elements
+        is decoded with raw_decode, so text around it (even bracketed, like
+        "[see clause 3]") is ignored. Without such an array no answers are
+        returned: a list of another length cannot be matched to the
+        questions by position.
+        """
+        answers: List[Optional[str]] = [None] * expected
+        decoder = json.JSONDecoder()
+        parsed = None
+        start = response.find("[")
+        while start >= 0:
+            try:
+                parsed, _ = decoder.raw_decode(response, start)
+            except ValueError:
+                parsed = None
+            if isinstance(parsed, list) and len(parsed) == expected:
+                break
+            parsed = None
+            start = response.find("[", start + 1)
+        if parsed is None:
+            return answers
+        for i, answer in enumerate(parsed):
+            if isinstance(answer, str) and answer.strip():
+                answers[i] = answer.strip()
+        return answers
+    
+    def get_stats(self):
+        return {
+            **{name: scheduler.get_stats() for name, scheduler in self.schedulers.items()},
+            "routing": self.router.get_stats()
+        }
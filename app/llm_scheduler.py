@@ -0,0 +1,108 @@
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+import openai
+
+def is_retryable_error(error: Exception) -> bool:
+    """Whether a provider error is transient (429, 5xx, timeouts, dropped connections)"""
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    # Groq's SDK mirrors the OpenAI exception hierarchy under its own module
+    if type(error).__name__ in ("APIConnectionError", "APITimeoutError"):
+        return True
+    status_code = getattr(error, "status_code", None)
+    return status_code == 429 or (status_code is not None and status_code >= 500)
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Read a Retry-After header from a provider error, if present"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 8.0) -> float:
+    """Exponential backoff with full jitter for the given (1-based) attempt"""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+class TokenBucket:
+    """Continuously refilling token bucket; a rate of 0 disables limiting"""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def acquire(self, amount: float = 1.0):
+        """Wait until amount tokens are available and take them"""
+        if self.rate <= 0:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        amount = min(amount, self.capacity)
+        # Waiters queue on the lock, so the bucket is served in FIFO order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+class ProviderScheduler:
+    """Admission control for one LLM provider.
+
+    Calls are limited to max_concurrency in flight and pass through
+    requests-per-minute and tokens-per-minute buckets. Transient failures
+    are retried with jittered exponential backoff, honouring Retry-After.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, rpm: int = 0, tpm: int = 0,
+                 max_retries: int = 3):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.stats = {"calls": 0, "retries": 0, "failures": 0, "rate_limited": 0}
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def run(self, fn: Callable[[], Awaitable[Any]], estimated_tokens: int = 0) -> Any:
+        """Run fn() under this provider's limits, retrying transient errors"""
+        attempt = 0
+        while True:
+            await self.requests.acquire(1)
+            await self.tokens.acquire(estimated_tokens)
+            async with self._get_semaphore():
+                self.stats["calls"] += 1
+                try:
+                    return await fn()
+                except Exception as e:
+                    if getattr(e, "status_code", None) == 429:
+                        self.stats["rate_limited"] += 1
+                    if attempt >= self.max_retries or not is_retryable_error(e):
+                        self.stats["failures"] += 1
+                        raise
+                    error = e
+            attempt += 1
+            self.stats["retries"] += 1
+            delay = retry_after_seconds(error) or backoff_delay(attempt)
+            print(f"{self.name} call failed ({error}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    def get_stats(self) -> Dict[str, int]:
+        return dict(self.stats)
@@ -0,0 +1,226 @@
+import json
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+import numpy as np
+from app.models import SearchResult
+from config import settings
+
+class _Namespace:
+    """Vectors, ids and metadata of one document"""
+
+    def __init__(self, ids: List[str], vectors: np.ndarray, metadatas: List[Dict[str, Any]]):
+        self.ids = ids
+        self.vectors = vectors
+        self.metadatas = metadatas
+        self.positions = {vector_id: i for i, vector_id in enumerate(ids)}
+
+class LocalVectorIndex:
+    """In-process dense vector index.
+
+    Each namespace (one per document) is a contiguous float32 matrix scored
+    with a single matrix-vector product; top-k selection uses argpartition.
+    Namespaces are persisted as .npy files under settings.cache_dir and
+    memory-mapped on load, so a restart costs no re-embedding and loaded
+    namespaces share pages with the OS file cache. meta.json records the
+    metric, embedding model, dimension and chunking signature; a namespace
+    written under different ones counts as missing and is rebuilt.
+    """
+
+    def __init__(self, index_dir: Optional[str] = None, embedding_model: str = "", chunking: str = ""):
+        self.index_dir = index_dir or os.path.join(settings.cache_dir, "index")
+        self.metric = settings.local_index_metric
+        self.embedding_model = embedding_model
+        self.chunking = chunking
+        self.max_namespaces = settings.local_index_max_namespaces
+        self._namespaces: "OrderedDict[str, _Namespace]" = OrderedDict()
+        self._unsaved = set()
+        self._lock = threading.RLock()
+        try:
+            os.makedirs(self.index_dir, exist_ok=True)
+        except Exception as e:
+            print(f"Warning: Local index directory unavailable: {e}")
+
+    def has_namespace(self, namespace: str) -> bool:
+        """Check whether a namespace is fully written (loaded or persisted) with the current signature"""
+        with self._lock:
+            if namespace in self._unsaved:
+                return False
+            if namespace in self._namespaces:
+                return True
+        return self._get_namespace(namespace) is not None
+
+    def count(self, namespace: str) -> int:
+        entry = self._get_namespace(namespace)
+        return len(entry.ids) if entry else 0
+
+    def upsert(self, namespace: str, ids: List[str], vectors: np.ndarray,
+               metadatas: List[Dict[str, Any]], persist: bool = True):
+        """Insert or replace vectors in a namespace.
+
+        With persist=False the namespace is only updated in memory (and does
+        not count as present) until persist() is called, so streamed batches
+        do not rewrite the vector file each time.
+        """
+        vectors = self._prepare(np.asarray(vectors, dtype=np.float32))
+        with self._lock:
+            entry = self._get_namespace(namespace)
+            if entry is None:
+                all_ids, all_vectors, all_metadatas = [], vectors[:0], []
+            else:
+                all_ids, all_vectors, all_metadatas = list(entry.ids), np.array(entry.vectors), list(entry.metadatas)
+            positions = {vector_id: i for i, vector_id in enumerate(all_ids)}
+
+            new_rows = []
+            for row, (vector_id, metadata) in enumerate(zip(ids, metadatas)):
+                if vector_id in positions:
+                    all_vectors[positions[vector_id]] = vectors[row]
+                    all_metadatas[positions[vector_id]] = metadata
+                else:
+                    positions[vector_id] = len(all_ids)
+                    all_ids.append(vector_id)
+                    all_metadatas.append(metadata)
+                    new_rows.append(row)
+            if new_rows:
+                all_vectors = np.vstack([all_vectors, vectors[new_rows]]) if len(all_vectors) else vectors[new_rows]
+
+            entry = _Namespace(all_ids, np.ascontiguousarray(all_vectors, dtype=np.float32), all_metadatas)
+            self._remember(namespace, entry)
+            if persist:
+                self._unsaved.discard(namespace)
+                self._save(namespace, entry)
+            else:
+                self._unsaved.add(namespace)
+
+    def persist(self, namespace: str):
+        """Write a namespace built with persist=False to disk"""
+        with self._lock:
+            entry = self._namespaces.get(namespace)
+            if entry is None:
+                return
+            self._unsaved.discard(namespace)
+            self._save(namespace, entry)
+
+    def query(self, namespace: str, vector: List[float], top_k: int = 5) -> List[SearchResult]:
+        """Return the top_k most similar vectors in a namespace"""
+        return self.query_batch(namespace, np.asarray(vector, dtype=np.float32).reshape(1, -1), top_k)[0]
+
+    def query_batch(self, namespace: str, vectors: np.ndarray, top_k: int = 5) -> List[List[SearchResult]]:
+        """Return the top_k most similar vectors for each query row, scored with one matrix product"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        entry = self._get_namespace(namespace)
+        if entry is None or len(entry.ids) == 0:
+            return [[] for _ in range(len(vectors))]
+
+        queries = self._prepare(vectors.reshape(len(vectors), -1))
+        if queries.shape[1] != entry.vectors.shape[1]:
+            raise Exception(
+                f"Query dimension {queries.shape[1]} does not match namespace dimension {entry.vectors.shape[1]}"
+            )
+        scores = queries @ entry.vectors.T
+        k = min(top_k, scores.shape[1])
+        if k < scores.shape[1]:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(scores.shape[1]), (len(scores), 1))
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        top = np.take_along_axis(top, np.argsort(-top_scores, axis=1), axis=1)
+
+        batch_results = []
+        for row, positions in enumerate(top):
+            results = []
+            for position in positions:
+                metadata = entry.metadatas[position]
+                results.append(SearchResult(
+                    content=metadata.get("content", ""),
+                    score=float(scores[row, position]),
+                    metadata=metadata
+                ))
+            batch_results.append(results)
+        return batch_results
+
+    def delete_namespace(self, namespace: str):
+        with self._lock:
+            self._namespaces.pop(namespace, None)
+            self._unsaved.discard(namespace)
+            shutil.rmtree(self._namespace_dir(namespace), ignore_errors=True)
+
+    # Internals
+
+    def _prepare(self, vectors: np.ndarray) -> np.ndarray:
+        """L2-normalize rows for cosine similarity so scoring is a dot product"""
+        if self.metric != "cosine" or vectors.size == 0:
+            return vectors
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _signature(self) -> Dict[str, str]:
+        return {"metric": self.metric, "embedding_model": self.embedding_model, "chunking": self.chunking}
+
+    def _namespace_dir(self, namespace: str) -> str:
+        safe_name = re.sub(r'[^A-Za-z0-9_.-]', '_', namespace)
+        return os.path.join(self.index_dir, safe_name)
+
+    def _get_namespace(self, namespace: str) -> Optional[_Namespace]:
+        with self._lock:
+            entry = self._namespaces.get(namespace)
+            if entry is not None:
+                self._namespaces.move_to_end(namespace)
+                return entry
+            entry = self._load(namespace)
+            if entry is not None:
+                self._remember(namespace, entry)
+            return entry
+
+    def _remember(self, namespace: str, entry: _Namespace):
+        self._namespaces[namespace] = entry
+        self._namespaces.move_to_end(namespace)
+        while len(self._namespaces) > self.max_namespaces:
+            # Namespaces still being built are kept until they are persisted
+            evictable = next((name for name in self._namespaces if name not in self._unsaved), None)
+            if evictable is None:
+                break
+            self._namespaces.pop(evictable)
+
+    def _save(self, namespace: str, entry: _Namespace):
+        directory = self._namespace_dir(namespace)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            tmp_vectors = os.path.join(directory, "vectors.tmp.npy")
+            np.save(tmp_vectors, entry.vectors)
+            os.replace(tmp_vectors, os.path.join(directory, "vectors.npy"))
+            tmp_meta = os.path.join(directory, "meta.json.tmp")
+            with open(tmp_meta, "w", encoding="utf-8") as f:
+                json.dump({
+                    **self._signature(),
+                    "dimension": int(entry.vectors.shape[1]) if entry.vectors.ndim == 2 else 0,
+                    "ids": entry.ids,
+                    "metadatas": entry.metadatas
+                }, f)
+            # meta.json is written last: its presence marks a complete namespace
+            os.replace(tmp_meta, os.path.join(directory, "meta.json"))
+        except Exception as e:
+            print(f"Warning: Failed to persist local index namespace {namespace}: {e}")
+
+    def _load(self, namespace: str) -> Optional[_Namespace]:
+        directory = self._namespace_dir(namespace)
+        meta_path = os.path.join(directory, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            # Vectors from another model or chunks from another chunker would be meaningless
+            if any(meta.get(key) != value for key, value in self._signature().items()):
+                return None
+            vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+            if vectors.ndim != 2 or vectors.shape[1] != meta.get("dimension"):
+                return None
+            return _Namespace(meta["ids"], vectors, meta["metadatas"])
+        except Exception as e:
+            print(f"Warning: Failed to load local index namespace {namespace}: {e}")
+            return None
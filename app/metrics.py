@@ -0,0 +1,237 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+# Per-request stage durations, shared by the tasks a request spawns
+_trace: ContextVar[Optional[Dict[str, float]]] = ContextVar("trace", default=None)
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+def _snapshot_key(key: LabelKey) -> str:
+    return ",".join(f"{name}={value}" for name, value in key) or "total"
+
+def _format_labels(key: LabelKey, extra: Optional[Dict[str, str]] = None) -> str:
+    pairs = list(key) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value:g}")
+        return lines
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {_snapshot_key(key): value for key, value in self._values.items()}
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+class _Series:
+    def __init__(self, bucket_count: int, window: int):
+        self.buckets = [0] * bucket_count
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=window)
+
+class Histogram:
+    """Cumulative bucket histogram plus p50/p95/p99 over a window of recent samples"""
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, window: int = 1024):
+        self.name = name
+        self.help = help
+        self.bounds = tuple(sorted(buckets))
+        self.window = window
+        self._series: Dict[LabelKey, _Series] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series(len(self.bounds), self.window)
+            for i, bound in enumerate(self.bounds):
+                if value <= bound:
+                    series.buckets[i] += 1
+            series.sum += value
+            series.count += 1
+            series.recent.append(value)
+
+    def percentiles(self, **labels) -> Dict[str, float]:
+        with self._lock:
+            series = self._series.get(_label_key(labels))
+            if series is None or not series.recent:
+                return {}
+            samples = np.fromiter(series.recent, dtype=np.float64)
+        values = np.percentile(samples, [q * 100 for q in self.QUANTILES])
+        return {f"p{int(q * 100)}": float(v) for q, v in zip(self.QUANTILES, values)}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        quantile_lines = [
+            f"# HELP {self.name}_recent {self.help} (last {self.window} samples)",
+            f"# TYPE {self.name}_recent summary"
+        ]
+        with self._lock:
+            items = [(key, series, list(series.recent)) for key, series in sorted(self._series.items(), key=lambda item: item[0])]
+        for key, series, recent in items:
+            for bound, count in zip(self.bounds, series.buckets):
+                lines.append(f"{self.name}_bucket{_format_labels(key, {'le': f'{bound:g}'})} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, {'le': '+Inf'})} {series.count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {series.sum:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {series.count}")
+
+            if recent:
+                values = np.percentile(recent, [q * 100 for q in self.QUANTILES])
+                for q, value in zip(self.QUANTILES, values):
+                    quantile_lines.append(f"{self.name}_recent{_format_labels(key, {'quantile': f'{q:g}'})} {value:.6f}")
+                quantile_lines.append(f"{self.name}_recent_sum{_format_labels(key)} {sum(recent):.6f}")
+                quantile_lines.append(f"{self.name}_recent_count{_format_labels(key)} {len(recent)}")
+        return lines + quantile_lines
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        result = {}
+        for key in list(self._series):
+            series = self._series[key]
+            result[_snapshot_key(key)] = {
+                "count": series.count,
+                "mean": series.sum / series.count if series.count else 0.0,
+                **self.percentiles(**dict(key))
+            }
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+class MetricsRegistry:
+    """Named counters and histograms rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str) -> Counter:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = Counter(name, help)
+            return metric
+
+    def histogram(self, name: str, help: str, **kwargs) -> Histogram:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = Histogram(name, help, **kwargs)
+            return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, object]:
+        return {name: metric.snapshot() for name, metric in list(self._metrics.items())}
+
+    def reset(self):
+        """Clear all recorded values (used between benchmark phases)"""
+        for metric in list(self._metrics.values()):
+            metric.reset()
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram("hackrx_stage_seconds", "Duration of pipeline stages in seconds")
+REQUEST_SECONDS = registry.histogram("hackrx_request_seconds", "HTTP request duration in seconds")
+CACHE_LOOKUPS = registry.counter("hackrx_cache_lookups_total", "Cache lookups by cache and result")
+LLM_TOKENS = registry.counter("hackrx_llm_tokens_total", "LLM tokens used by provider and kind")
+LLM_CALLS = registry.counter("hackrx_llm_calls_total", "LLM completions by provider and outcome")
+LLM_FALLBACKS = registry.counter("hackrx_llm_fallbacks_total", "Completions handed to the fallback provider")
+LLM_HEDGES = registry.counter("hackrx_llm_hedges_total", "Hedged completions by provider and result (started, won)")
+ANSWERS = registry.counter("hackrx_answers_total", "Answers by source (answer_cache, semantic_cache, extractive, llm)")
+
+ANSWER_SOURCES = ("answer_cache", "semantic_cache", "extractive", "llm")
+
+def record_cache(cache: str, hits: int, misses: int):
+    """Count cache hits and misses for one lookup batch"""
+    if hits:
+        CACHE_LOOKUPS.inc(hits, cache=cache, result="hit")
+    if misses:
+        CACHE_LOOKUPS.inc(misses, cache=cache, result="miss")
+
+def record_answers(source: str, count: int):
+    """Count answers served by one source"""
+    if count:
+        ANSWERS.inc(count, source=source)
+
+def answer_sources() -> Dict[str, float]:
+    """Answers per source plus the fraction served without an LLM call"""
+    counts = {source: ANSWERS.value(source=source) for source in ANSWER_SOURCES}
+    total = sum(counts.values())
+    return {**counts, "without_llm_ratio": round(1 - counts["llm"] / total, 4) if total else 0.0}
+
+def observe_stage(stage: str, seconds: float):
+    """Record a stage duration in the histogram and in the current request trace"""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    trace = _trace.get()
+    if trace is not None:
+        trace[stage] = trace.get(stage, 0.0) + seconds
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Time the enclosed block as a pipeline stage (usable in sync and async code)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+def start_trace(trace: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+    """Begin collecting stage durations for the current request (into trace, if given)"""
+    trace = {} if trace is None else trace
+    _trace.set(trace)
+    return trace
+
+def merge_trace(stages: Dict[str, float]):
+    """Add stage durations collected elsewhere (e.g. by shared work) to the current request trace"""
+    trace = _trace.get()
+    if trace is not None:
+        for stage, seconds in stages.items():
+            trace[stage] = trace.get(stage, 0.0) + seconds
+
+def server_timing_header(trace: Dict[str, float]) -> str:
+    """Format stage durations as a Server-Timing header value (milliseconds)"""
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in trace.items())
@@ -11,6 +11,7 @@ class SearchResult(BaseModel):
     content: str
     score: float
     metadata: Dict[str, Any] = {}
+    scores: Dict[str, float] = {}  # Per-source scores, e.g. {"dense": 0.82, "lexical": 7.1}
 
 class QueryRequest(BaseModel):
     """Request model for document queries"""
@@ -19,4 +20,20 @@ class QueryRequest(BaseModel):
 
 class QueryResponse(BaseModel):
     """Response model for document queries"""
-    answers: List[str]  # List of answers corresponding to questions 
\ No newline at end of file
+    answers: List[str]  # List of answers corresponding to questions 
+
+class IngestRequest(BaseModel):
+    """Request model for background document ingestion"""
+    documents: str  # URL to the document
+
+class IngestJob(BaseModel):
+    """Status of a background ingestion job"""
+    job_id: str
+    url: str
+    status: str  # "queued", "running", "completed" or "failed"
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    content_hash: Optional[str] = None
+    chunks: Optional[int] = None
+    error: Optional[str] = None
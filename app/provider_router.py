@@ -0,0 +1,231 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from app.metrics import LLM_CALLS, LLM_FALLBACKS, LLM_HEDGES, observe_stage
+from config import settings
+
+Call = Callable[[], Awaitable[str]]
+
+class ProviderHealth:
+    """Latency and error tracking plus a circuit breaker for one LLM provider.
+
+    Latency and error rate are exponentially weighted moving averages; the
+    recent successful latencies give the percentile used as hedge delay.
+    After llm_breaker_failures consecutive failures the breaker opens and
+    the provider is skipped for llm_breaker_cooldown seconds, then a single
+    probe call is let through (half-open) to close or reopen it.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.ewma_latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.recent = deque(maxlen=settings.llm_latency_window)
+        self.consecutive_failures = 0
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.probe_started: Optional[float] = None
+        self.stats = {"successes": 0, "failures": 0, "cancelled": 0, "breaker_opened": 0}
+
+    def _update_latency(self, seconds: float):
+        alpha = settings.llm_ewma_alpha
+        self.ewma_latency = seconds if self.ewma_latency is None else alpha * seconds + (1 - alpha) * self.ewma_latency
+
+    def record_success(self, seconds: float):
+        if self.state != "closed":
+            # A successful probe: start over instead of carrying the outage in the averages
+            print(f"✅ {self.name} circuit closed")
+            self.state = "closed"
+            self.ewma_latency = None
+            self.error_rate = 0.0
+        self._update_latency(seconds)
+        self.recent.append(seconds)
+        self.error_rate *= 1 - settings.llm_ewma_alpha
+        self.consecutive_failures = 0
+        self.stats["successes"] += 1
+        self.probe_started = None
+
+    def record_failure(self):
+        alpha = settings.llm_ewma_alpha
+        self.error_rate = alpha + (1 - alpha) * self.error_rate
+        self.consecutive_failures += 1
+        self.stats["failures"] += 1
+        self.probe_started = None
+        if self.state == "half_open" or (
+            self.state == "closed" and self.consecutive_failures >= settings.llm_breaker_failures
+        ):
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.stats["breaker_opened"] += 1
+            print(f"⚠️ {self.name} circuit opened for {settings.llm_breaker_cooldown:.0f}s")
+
+    def record_cancelled(self, seconds: float):
+        """A hedged call that lost: its latency is a lower bound, which still counts as a sample.
+
+        Otherwise a provider that is slow but never fails would always lose
+        the hedge, never collect samples and never be moved down.
+        """
+        self._update_latency(seconds)
+        self.recent.append(seconds)
+        self.stats["cancelled"] += 1
+        self.probe_started = None
+
+    def available(self) -> bool:
+        """Whether a call may be sent now; when half-open, only one probe per cooldown period"""
+        now = time.monotonic()
+        if self.state == "open" and now - self.opened_at >= settings.llm_breaker_cooldown:
+            self.state = "half_open"
+        if self.state == "closed":
+            return True
+        # A probe slot is reclaimed if its call never reported back (e.g. it was never needed)
+        if self.state == "half_open" and (
+            self.probe_started is None or now - self.probe_started >= settings.llm_breaker_cooldown
+        ):
+            self.probe_started = now
+            return True
+        return False
+
+    def expected_cost(self) -> float:
+        """Expected latency inflated by the error rate, for ordering providers"""
+        return (self.ewma_latency or 0.0) / max(0.05, 1.0 - self.error_rate)
+
+    def hedge_delay(self) -> float:
+        """Seconds to wait on this provider before hedging: its recent latency percentile"""
+        if len(self.recent) < settings.llm_hedge_min_samples:
+            return settings.llm_hedge_initial_delay
+        delay = float(np.percentile(np.fromiter(self.recent, dtype=np.float64), settings.llm_hedge_percentile))
+        return min(settings.llm_hedge_max_delay, max(settings.llm_hedge_min_delay, delay))
+
+    def get_stats(self) -> Dict[str, object]:
+        return {
+            "state": self.state,
+            "ewma_latency": round(self.ewma_latency, 4) if self.ewma_latency is not None else None,
+            "error_rate": round(self.error_rate, 4),
+            "hedge_delay": round(self.hedge_delay(), 4),
+            **self.stats
+        }
+
+class ProviderRouter:
+    """Picks the LLM provider for each completion and hedges slow calls.
+
+    Providers are tried in configured order, or by expected latency once
+    the first one is clearly slower than another (llm_routing_margin,
+    settings.llm_latency_routing). Calls that lost a hedge count as samples
+    of at least their elapsed time.
+    Providers with an open circuit are skipped unless every one is open.
+    With hedging, when the first provider has not answered within its hedge
+    delay the next one is started too; the first successful answer wins and
+    the other call is cancelled. A failed call falls through to the next
+    provider as before.
+    """
+
+    def __init__(self, names: List[str]):
+        self.health = {name: ProviderHealth(name) for name in names}
+        self.stats = {"hedged": 0, "hedge_wins": 0}
+
+    def order(self, names: List[str]) -> List[str]:
+        """Providers to try for one call, best first; a half-open provider's probe goes first"""
+        probes, available = [], []
+        for name in names:
+            health = self.health[name]
+            if health.available():
+                (probes if health.state == "half_open" else available).append(name)
+        if not probes and not available:
+            # Every circuit is open: trying is better than failing outright
+            return list(names)
+        if settings.llm_latency_routing and self._clearly_slower_first(available):
+            available.sort(key=lambda name: self.health[name].expected_cost())
+        return probes + available
+
+    def _clearly_slower_first(self, names: List[str]) -> bool:
+        """Whether the first provider's expected latency is llm_routing_margin times another's.
+
+        Providers with too few samples to judge keep the configured order.
+        """
+        if len(names) < 2 or any(self.health[name].ewma_latency is None for name in names):
+            return False
+        first = self.health[names[0]].expected_cost()
+        best = min(self.health[name].expected_cost() for name in names[1:])
+        return first > best * settings.llm_routing_margin
+
+    async def _attempt(self, name: str, call: Call) -> str:
+        """Run one provider call, recording latency, outcome and breaker state"""
+        health = self.health[name]
+        start = time.perf_counter()
+        try:
+            answer = await call()
+        except asyncio.CancelledError:
+            health.record_cancelled(time.perf_counter() - start)
+            LLM_CALLS.inc(provider=name, outcome="cancelled")
+            raise
+        except Exception:
+            observe_stage("llm_completion", time.perf_counter() - start)
+            health.record_failure()
+            LLM_CALLS.inc(provider=name, outcome="error")
+            raise
+        elapsed = time.perf_counter() - start
+        observe_stage("llm_completion", elapsed)
+        health.record_success(elapsed)
+        LLM_CALLS.inc(provider=name, outcome="ok")
+        return answer
+
+    async def run(self, calls: Dict[str, Call], hedge: bool = True,
+                  fallback_allowed: Callable[[], bool] = lambda: True) -> Tuple[str, str]:
+        """Complete with the best provider; returns (provider, answer).
+
+        calls maps provider names to zero-argument coroutine factories, in
+        configured preference order. Raises the last error if every provider
+        failed, or right away once fallback_allowed() is False (e.g. a
+        streamed answer already delivered tokens).
+        """
+        order = self.order(list(calls))
+        hedge = hedge and settings.llm_hedging_enabled
+        error: Optional[BaseException] = None
+        position = 0
+        running: Dict[asyncio.Task, str] = {}
+        hedges = set()
+        try:
+            while position < len(order) or running:
+                if not running:
+                    if position > 0:
+                        LLM_FALLBACKS.inc(source=order[position - 1], target=order[position])
+                    name = order[position]
+                    running[asyncio.create_task(self._attempt(name, calls[name]))] = name
+                    position += 1
+
+                can_hedge = hedge and len(running) == 1 and position < len(order)
+                timeout = self.health[next(iter(running.values()))].hedge_delay() if can_hedge else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    # The current call is slower than usual: race the next provider against it
+                    name = order[position]
+                    print(f"⏱️ Hedging LLM call to {name} after {timeout:.2f}s")
+                    task = asyncio.create_task(self._attempt(name, calls[name]))
+                    running[task] = name
+                    hedges.add(task)
+                    position += 1
+                    self.stats["hedged"] += 1
+                    LLM_HEDGES.inc(provider=name, result="started")
+                    continue
+
+                for task in done:
+                    name = running.pop(task)
+                    if task.exception() is None:
+                        if task in hedges:
+                            self.stats["hedge_wins"] += 1
+                            LLM_HEDGES.inc(provider=name, result="won")
+                        return name, task.result()
+                    error = task.exception()
+                    print(f"{name} generation failed: {error}")
+                if not running and not fallback_allowed():
+                    raise error
+        finally:
+            for task in running:
+                task.cancel()
+        raise error or Exception("No LLM provider available")
+
+    def get_stats(self) -> Dict[str, object]:
+        return {**self.stats, "providers": {name: health.get_stats() for name, health in self.health.items()}}
@@ -1,10 +1,20 @@
 import asyncio
 import time
-from typing import List, Dict, Any
-from app.document_processor import DocumentProcessor
+from typing import AsyncIterator, Callable, List, Dict, Any, Optional, Tuple
+import numpy as np
+from app.document_processor import DocumentProcessor, DownloadResult
+from app.document_cache import DocumentCache
+from app.single_flight import SingleFlight
+from app.ingestion import IngestionQueue
+from app.models import DocumentChunk
 from app.vector_store import VectorStore
-from app.llm_processor import LLMProcessor
-from app.models import QueryRequest, QueryResponse
+from app.llm_processor import LLMProcessor, PROMPT_VERSION, is_error_answer
+from app.answer_cache import AnswerCache, normalize_question
+from app.semantic_cache import SemanticCache
+from app.reranker import Reranker
+from app.extractive import confident_answer
+from app.metrics import answer_sources, merge_trace, record_answers, record_cache, start_trace, timed
+from app.models import QueryRequest, QueryResponse, SearchResult
 from config import settings
 
 class QueryEngine:
@@ -12,47 +22,305 @@ class QueryEngine:
         self.document_processor = DocumentProcessor()
         self.vector_store = VectorStore()
         self.llm_processor = LLMProcessor()
-        self.document_cache = {}
+        self.document_cache = DocumentCache()
+        self.document_flights = SingleFlight()
+        self.answer_cache = AnswerCache()
+        self.semantic_cache = None
+        if settings.semantic_cache_enabled and self.vector_store.embedding_service.is_available():
+            self.semantic_cache = SemanticCache()
+        self.reranker = None
+        if settings.rerank_enabled:
+            if Reranker.is_available():
+                self.reranker = Reranker()
+            else:
+                print("Warning: rerank_enabled is set but sentence-transformers is not installed. Reranking disabled.")
+        self.ingestion = IngestionQueue(self.prepare_document)
+    
+    async def prepare_document(self, url: str) -> Tuple[str, List[DocumentChunk]]:
+        """Load and index a document, sharing one pipeline among concurrent callers.
+        
+        The shared pipeline runs outside any request's context, so each
+        caller's trace records its wait as ingest_wait, and the caller that
+        started the pipeline also gets the pipeline's own stages.
+        """
+        stages: Dict[str, float] = {}
+        
+        async def ingest() -> Tuple[str, List[DocumentChunk]]:
+            start_trace(stages)
+            return await self._ingest_document(url)
+        
+        try:
+            with timed("ingest_wait"):
+                return await self.document_flights.do(url, ingest)
+        finally:
+            merge_trace(stages)
+    
+    async def _ingest_document(self, url: str) -> Tuple[str, List[DocumentChunk]]:
+        """Load a document and index it; fresh documents stream chunk batches straight into the indexes"""
+        with timed("ingest"):
+            return await self._ingest(url)
+    
+    async def _ingest(self, url: str) -> Tuple[str, List[DocumentChunk]]:
+        content_hash, chunks, download = await self.resolve_document(url)
+        if chunks is not None:
+            await self.vector_store.store_documents(chunks, namespace=content_hash)
+            return content_hash, chunks
+        
+        print("📄 Processing document...")
+        batches = self.document_processor.iter_chunk_batches(url, download.content, settings.ingest_batch_size)
+        # Drop this reference; the page iterator still keeps the bytes until extraction finishes
+        download.content = b""
+        chunks = await self.vector_store.store_documents_stream(batches, namespace=content_hash)
+        await asyncio.to_thread(self.document_cache.put, content_hash, chunks)
+        self.document_cache.record_url(url, content_hash, download.etag, download.last_modified)
+        print(f"✅ Document processed: {len(chunks)} chunks")
+        return content_hash, chunks
+    
+    async def resolve_document(self, url: str) -> Tuple[str, Optional[List[DocumentChunk]], Optional[DownloadResult]]:
+        """Return (content hash, cached chunks, None) or, on a cache miss, (content hash, None, download)"""
+        cache = self.document_cache
+        record = cache.lookup_url(url)
+        
+        # Fresh URL record: no network round trip at all
+        if record and cache.is_fresh(record):
+            chunks = await asyncio.to_thread(cache.get, record["content_hash"])
+            if chunks is not None:
+                print("✅ Using cached document")
+                record_cache("document", 1, 0)
+                return record["content_hash"], chunks, None
+        
+        # Stale or unknown URL: (conditionally) download
+        if record and (record.get("etag") or record.get("last_modified")):
+            result = await self.document_processor.fetch_document(
+                url, etag=record.get("etag"), last_modified=record.get("last_modified")
+            )
+            if result.not_modified:
+                chunks = await asyncio.to_thread(cache.get, record["content_hash"])
+                if chunks is not None:
+                    print("✅ Document not modified, using cached copy")
+                    record_cache("document", 1, 0)
+                    cache.touch_url(url)
+                    return record["content_hash"], chunks, None
+                result = await self.document_processor.fetch_document(url)
+        else:
+            result = await self.document_processor.fetch_document(url)
+        
+        # Same bytes may already be cached under another URL
+        chunks = await asyncio.to_thread(cache.get, result.content_hash)
+        if chunks is None:
+            record_cache("document", 0, 1)
+            return result.content_hash, None, result
+        
+        print("✅ Using cached document (matched by content hash)")
+        record_cache("document", 1, 0)
+        cache.record_url(url, result.content_hash, result.etag, result.last_modified)
+        return result.content_hash, chunks, None
+    
+    async def embed_questions(self, questions: List[str]) -> Optional[np.ndarray]:
+        """Embed questions for retrieval and the semantic cache, one row per question.
+        
+        Questions that only differ in case, spacing or trailing punctuation
+        share one embedding. Returns None when nothing uses the vectors or
+        embedding fails (retrieval then embeds the questions itself).
+        """
+        if not questions or not (self.vector_store.uses_query_embeddings() or self.semantic_cache is not None):
+            return None
+        canonical = [normalize_question(question) for question in questions]
+        first: Dict[str, int] = {}
+        for i, key in enumerate(canonical):
+            first.setdefault(key, i)
+        try:
+            vectors = await self.vector_store.embedding_service.embed([questions[i] for i in first.values()])
+        except Exception as e:
+            print(f"Warning: Question embedding failed: {e}")
+            return None
+        rows = {key: row for row, key in enumerate(first)}
+        return vectors[[rows[key] for key in canonical]]
+    
+    def packs_questions(self, question_count: int, streaming: bool = False) -> bool:
+        """Whether answer_questions generates these answers in one packed LLM call"""
+        return settings.llm_pack_questions and question_count > 1 and not streaming
+    
+    def _semantic_scope(self, namespace: str, packed: bool) -> str:
+        """Semantic cache scope: answers are only reused for the same document, model and prompt"""
+        prompt_version = f"{PROMPT_VERSION}-packed" if packed else PROMPT_VERSION
+        return f"{namespace}:{self.llm_processor.model_signature()}:{prompt_version}"
+    
+    def _lookup_semantic(self, scope: str, vectors: np.ndarray) -> List[Optional[str]]:
+        matches = self.semantic_cache.lookup_many(scope, vectors)
+        hits = sum(1 for answer in matches if answer is not None)
+        record_cache("semantic", hits, len(matches) - hits)
+        record_answers("semantic_cache", hits)
+        return matches
+    
+    async def retrieve(self, url: str, questions: List[str], top_k: Optional[int] = None,
+                       packed: bool = False) -> Tuple[str, List[List[SearchResult]], Optional[np.ndarray], Optional[List[Optional[str]]]]:
+        """Index the document and retrieve chunks for the questions.
+        
+        Question-side work (normalizing and embedding the questions) runs
+        concurrently with document ingestion, and retrieval starts as soon
+        as the document's index is ready. Questions the semantic cache
+        already answers for this document (scoped as packed or not) are not
+        retrieved for. With a reranker, rerank_candidates chunks are
+        retrieved per question and only the best rerank_top_n kept.
+        Returns the namespace, the results per question (empty for cached
+        answers), the question embeddings (None if not computed) and the
+        semantic cache answers (None if the cache was not consulted).
+        """
+        top_k = top_k or settings.retrieval_top_k
+        question_task = asyncio.create_task(self.embed_questions(questions))
+        try:
+            # Concurrent requests for the same URL share one ingestion pipeline
+            namespace, _ = await self.prepare_document(url)
+            question_vectors = await question_task
+        finally:
+            question_task.cancel()
+        
+        cached_answers = None
+        if self.semantic_cache is not None and question_vectors is not None:
+            try:
+                cached_answers = self._lookup_semantic(self._semantic_scope(namespace, packed), question_vectors)
+            except Exception as e:
+                print(f"Warning: Semantic cache lookup failed: {e}")
+        missing = [i for i in range(len(questions)) if cached_answers is None or cached_answers[i] is None]
+        
+        results: List[List[SearchResult]] = [[] for _ in questions]
+        if missing:
+            # One batched search for the remaining questions, reusing their embeddings
+            missing_questions = [questions[i] for i in missing]
+            use_vectors = question_vectors is not None and self.vector_store.uses_query_embeddings()
+            found = await self.vector_store.search_similar_batch(
+                missing_questions, top_k=max(top_k, settings.rerank_candidates) if self.reranker else top_k,
+                namespace=namespace, query_embeddings=question_vectors[missing] if use_vectors else None
+            )
+            if self.reranker is not None:
+                # Retrieve wide, then keep only the chunks the cross-encoder rates best
+                found = await self.reranker.rerank_batch(missing_questions, found, min(top_k, settings.rerank_top_n))
+            for i, search_results in zip(missing, found):
+                results[i] = search_results
+        return namespace, results, question_vectors, cached_answers
+    
+    async def answer_questions(self, namespace: str, questions: List[str],
+                               results: List[List[SearchResult]],
+                               on_token: Optional[Callable[[int, str], None]] = None,
+                               question_vectors: Optional[np.ndarray] = None,
+                               cached_answers: Optional[List[Optional[str]]] = None) -> List[str]:
+        """Answer questions from their retrieved chunks, serving repeats from the answer cache.
+        
+        Questions whose answer is a single retrieved sentence found with
+        enough confidence skip the LLM (settings.extractive_enabled). With
+        on_token, generated answers are streamed and on_token(i, delta)
+        receives the tokens of question i (cached and extracted answers
+        arrive whole).
+        question_vectors (one row per question, from embed_questions) spare
+        the semantic cache its own embedding call; cached_answers (from
+        retrieve) means the semantic cache was already consulted.
+        """
+        packed = self.packs_questions(len(questions), streaming=on_token is not None)
+        prompt_version = f"{PROMPT_VERSION}-packed" if packed else PROMPT_VERSION
+        model = self.llm_processor.model_signature()
+        keys = [
+            self.answer_cache.make_key(
+                namespace,
+                question,
+                [result.metadata.get("vector_id") or self.vector_store.content_id(result.content)
+                 for result in search_results],
+                model,
+                prompt_version
+            )
+            for question, search_results in zip(questions, results)
+        ]
+        answers = list(cached_answers) if cached_answers is not None else [None] * len(questions)
+        lookup = [i for i, answer in enumerate(answers) if answer is None]
+        cached = await asyncio.to_thread(self.answer_cache.get_many, [keys[i] for i in lookup])
+        for i in lookup:
+            answers[i] = cached.get(keys[i])
+        pending = [i for i in lookup if answers[i] is None]
+        record_cache("answer", len(lookup) - len(pending), len(pending))
+        record_answers("answer_cache", len(lookup) - len(pending))
+        
+        # Paraphrases of earlier questions about this document reuse their answers
+        semantic_scope = self._semantic_scope(namespace, packed)
+        precomputed, question_vectors = question_vectors, None
+        if pending and self.semantic_cache is not None:
+            try:
+                if precomputed is not None:
+                    question_vectors = precomputed[pending]
+                else:
+                    question_vectors = await self.vector_store.embedding_service.embed([questions[i] for i in pending])
+                if cached_answers is None:
+                    for i, answer in zip(pending, self._lookup_semantic(semantic_scope, question_vectors)):
+                        answers[i] = answer
+            except Exception as e:
+                print(f"Warning: Semantic cache lookup failed: {e}")
+                question_vectors = None
+            if question_vectors is not None:
+                still_pending = [row for row, i in enumerate(pending) if answers[i] is None]
+                question_vectors = question_vectors[still_pending]
+                pending = [pending[row] for row in still_pending]
+        
+        if not pending:
+            print(f"✅ All {len(questions)} answers served from cache")
+            return answers
+        
+        # Fast path: a single high-confidence sentence from the top chunks answers the question
+        if settings.extractive_enabled:
+            with timed("extractive"):
+                extracted = [confident_answer(questions[i], results[i]) for i in pending]
+            still_pending = [row for row, answer in enumerate(extracted) if answer is None]
+            for i, answer in zip(pending, extracted):
+                if answer is not None:
+                    answers[i] = answer
+            record_answers("extractive", len(pending) - len(still_pending))
+            if question_vectors is not None:
+                question_vectors = question_vectors[still_pending]
+            pending = [pending[row] for row in still_pending]
+            if not pending:
+                print(f"✅ All {len(questions)} answers served without the LLM")
+                return answers
+        
+        pending_questions = [questions[i] for i in pending]
+        pending_results = [results[i] for i in pending]
+        if packed and len(pending) > 1:
+            # Several questions per call over a shared, deduplicated context
+            generated = await self.llm_processor.generate_answers_packed(pending_questions, pending_results)
+        else:
+            # Generate answers concurrently (bounded by the per-provider schedulers)
+            contexts = [self.llm_processor.build_context(search_results) for search_results in pending_results]
+            forward = (lambda row, delta: on_token(pending[row], delta)) if on_token else None
+            generated = await self.llm_processor.generate_answers_batch(pending_questions, contexts, forward)
+        
+        record_answers("llm", len(pending))
+        fresh = {}
+        for i, answer in zip(pending, generated):
+            answers[i] = answer
+            if not is_error_answer(answer):
+                fresh[keys[i]] = answer
+        await asyncio.to_thread(self.answer_cache.put_many, fresh)
+        
+        if question_vectors is not None:
+            answered = [row for row, i in enumerate(pending) if not is_error_answer(answers[i])]
+            self.semantic_cache.add_many(
+                semantic_scope,
+                question_vectors[answered],
+                [questions[pending[row]] for row in answered],
+                [answers[pending[row]] for row in answered]
+            )
+        return answers
     
     async def process_query_request(self, request: QueryRequest) -> QueryResponse:
         """Process a query request with optimized performance"""
         start_time = time.time()
         
         try:
-            # Check cache first
-            cache_key = request.documents
-            if cache_key in self.document_cache:
-                print("✅ Using cached document")
-                chunks = self.document_cache[cache_key]
-            else:
-                # Process document with smaller chunks for faster processing
-                print("📄 Processing document...")
-                chunks = await self.document_processor.process_document(request.documents)
-                self.document_cache[cache_key] = chunks
-                print(f"✅ Document processed: {len(chunks)} chunks")
-            
-            # Store documents in vector store
-            await self.vector_store.store_documents(chunks)
-            
-            # Process questions in parallel for faster response
-            answers = []
-            contexts = []
-            
-            # Get contexts for all questions first
-            for question in request.questions:
-                search_results = await self.vector_store.search_similar(question, top_k=3)  # Reduced from 5 to 3
-                context = "\n\n".join([result.content for result in search_results])
-                contexts.append(context)
+            # Index the document while the questions are embedded, then retrieve for all of them
+            namespace, results, question_vectors, cached_answers = await self.retrieve(
+                request.documents, request.questions, packed=self.packs_questions(len(request.questions))
+            )
             
-            # Generate answers in parallel
-            if len(request.questions) <= 3:
-                # For small number of questions, process sequentially for better quality
-                for i, question in enumerate(request.questions):
-                    answer = await self.llm_processor.generate_answer(question, contexts[i])
-                    answers.append(answer)
-            else:
-                # For multiple questions, use batch processing
-                answers = await self.llm_processor.generate_answers_batch(request.questions, contexts)
+            answers = await self.answer_questions(
+                namespace, request.questions, results, question_vectors=question_vectors, cached_answers=cached_answers
+            )
             
             processing_time = time.time() - start_time
             print(f"⏱️ Total processing time: {processing_time:.2f} seconds")
@@ -66,31 +334,97 @@ class QueryEngine:
                 answers=["Error processing request"] * len(request.questions)
             )
     
+    async def stream_query_request(self, request: QueryRequest, stream_tokens: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        """Answer a query request, yielding each answer as soon as it is ready.
+        
+        Events are dicts: {"event": "answer", "index", "answer"} per question
+        in completion order, {"event": "token", "index", "delta"} while an
+        answer is generated when stream_tokens is set, {"event": "error"} on
+        failure and, always last, {"event": "done", "processing_time"}.
+        """
+        start_time = time.time()
+        try:
+            # Answers are generated one question at a time, so the unpacked cache scope applies
+            namespace, results, question_vectors, cached_answers = await self.retrieve(request.documents, request.questions)
+        except Exception as e:
+            print(f"❌ Error processing query: {e}")
+            yield {"event": "error", "error": f"Error processing request: {str(e)}"}
+            yield {"event": "done", "processing_time": round(time.time() - start_time, 3)}
+            return
+        
+        events: asyncio.Queue = asyncio.Queue()
+        
+        async def answer_one(index: int, question: str, search_results: List[SearchResult]):
+            try:
+                on_token = None
+                if stream_tokens:
+                    on_token = lambda _, delta: events.put_nowait({"event": "token", "index": index, "delta": delta})
+                vectors = question_vectors[[index]] if question_vectors is not None else None
+                known = [cached_answers[index]] if cached_answers is not None else None
+                answers = await self.answer_questions(namespace, [question], [search_results], on_token, vectors, known)
+                answer = answers[0]
+            except Exception as e:
+                print(f"❌ Error answering question {index}: {e}")
+                answer = "Error processing request"
+            events.put_nowait({"event": "answer", "index": index, "answer": answer})
+        
+        tasks = [
+            asyncio.create_task(answer_one(i, question, search_results))
+            for i, (question, search_results) in enumerate(zip(request.questions, results))
+        ]
+        try:
+            remaining = len(tasks)
+            while remaining:
+                event = await events.get()
+                if event["event"] == "answer":
+                    remaining -= 1
+                yield event
+        finally:
+            # The client may disconnect mid-stream
+            for task in tasks:
+                task.cancel()
+        
+        processing_time = time.time() - start_time
+        print(f"⏱️ Total processing time: {processing_time:.2f} seconds")
+        yield {"event": "done", "processing_time": round(processing_time, 3)}
+    
     async def process_single_query(self, question: str, document_url: str) -> str:
         """Process a single query for faster response"""
         try:
-            # Check cache
-            if document_url in self.document_cache:
-                chunks = self.document_cache[document_url]
-            else:
-                chunks = await self.document_processor.process_document(document_url)
-                self.document_cache[document_url] = chunks
-            
-            await self.vector_store.store_documents(chunks)
-            search_results = await self.vector_store.search_similar(question, top_k=2)  # Reduced for speed
-            context = "\n\n".join([result.content for result in search_results])
-            
-            return await self.llm_processor.generate_answer(question, context)
+            namespace, results, question_vectors, cached_answers = await self.retrieve(document_url, [question], top_k=2)  # Reduced for speed
+            answers = await self.answer_questions(
+                namespace, [question], results, question_vectors=question_vectors, cached_answers=cached_answers
+            )
+            return answers[0]
             
         except Exception as e:
             print(f"❌ Error in single query: {e}")
             return f"Error: {str(e)}"
     
+    def get_cache_info(self) -> Dict[str, Any]:
+        """Get document cache and request coalescing information"""
+        return {
+            **self.document_cache.get_info(),
+            "single_flight": self.document_flights.get_stats(),
+            "answer_cache": self.answer_cache.get_info(),
+            "semantic_cache": self.semantic_cache.get_info() if self.semantic_cache else None,
+            "reranker": self.reranker.get_info() if self.reranker else None,
+            "ingestion": self.ingestion.get_stats(),
+            "answer_sources": answer_sources()
+        }
+    
     async def health_check(self) -> Dict[str, Any]:
         """Check system health"""
         return {
             "status": "healthy",
             "llm_available": self.llm_processor.client is not None or self.llm_processor.groq_client is not None,
-            "vector_store_available": self.vector_store.index is not None or self.vector_store.fallback_search is not None,
-            "cache_size": len(self.document_cache)
+            "vector_store_available": (
+                self.vector_store.index is not None
+                or self.vector_store.local_index is not None
+                or len(self.vector_store.lexical_indexes) > 0
+            ),
+            "cache_size": len(self.document_cache),
+            "coalesced_requests": self.document_flights.stats["coalesced"],
+            "answer_cache_hits": self.answer_cache.stats["hits"],
+            "llm_providers": self.llm_processor.router.get_stats()["providers"]
         } 
\ No newline at end of file
@@ -0,0 +1,149 @@
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from app.answer_cache import normalize_question
+from app.metrics import record_cache, timed
+from app.models import SearchResult
+from config import settings
+
+PairKey = Tuple[str, str]
+
+class Reranker:
+    """Re-scores retrieved chunks with a local sentence-transformers cross-encoder.
+
+    rerank_batch() takes the candidates of every question in a request,
+    scores all (question, chunk) pairs not in the score cache in one pass -
+    split into batches of settings.rerank_batch_size run on a small thread
+    pool (the model releases the GIL during inference) - and keeps the best
+    top_n chunks per question. Scores are cached per (normalized question,
+    chunk text) in a bounded LRU.
+    """
+
+    def __init__(self):
+        self.model_name = settings.rerank_model
+        self.max_entries = settings.rerank_cache_max_entries
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._scores: "OrderedDict[PairKey, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._failed = False
+        self.stats = {"pairs_scored": 0, "hits": 0, "misses": 0, "failures": 0}
+
+    @staticmethod
+    def is_available() -> bool:
+        try:
+            import sentence_transformers  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def _get_model(self):
+        """Load the cross-encoder on first use"""
+        with self._model_lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+                self._model = CrossEncoder(self.model_name, max_length=settings.rerank_max_length)
+                print(f"✅ Loaded reranker model: {self.model_name}")
+            return self._model
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=settings.rerank_workers, thread_name_prefix="rerank")
+        return self._executor
+
+    def _predict(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        scores = self._get_model().predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+        return [float(score) for score in scores]
+
+    @staticmethod
+    def _key(question: str, content: str) -> PairKey:
+        return normalize_question(question), hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    async def score_pairs(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        """Cross-encoder scores for (question, chunk text) pairs, using and filling the cache"""
+        keys = [self._key(question, content) for question, content in pairs]
+        scores: Dict[PairKey, float] = {}
+        with self._lock:
+            for key in keys:
+                if key in self._scores:
+                    self._scores.move_to_end(key)
+                    scores[key] = self._scores[key]
+
+        hits = sum(1 for key in keys if key in scores)
+        missing: Dict[PairKey, Tuple[str, str]] = {}
+        for key, pair in zip(keys, pairs):
+            if key not in scores:
+                missing.setdefault(key, pair)
+        self.stats["hits"] += hits
+        self.stats["misses"] += len(missing)
+        record_cache("rerank", hits, len(missing))
+
+        if missing:
+            missing_keys = list(missing)
+            missing_pairs = [missing[key] for key in missing_keys]
+            batch_size = settings.rerank_batch_size
+            loop = asyncio.get_running_loop()
+            executor = self._get_executor()
+            with timed("rerank"):
+                batches = await asyncio.gather(*[
+                    loop.run_in_executor(executor, self._predict, missing_pairs[i:i + batch_size])
+                    for i in range(0, len(missing_pairs), batch_size)
+                ])
+            fresh = dict(zip(missing_keys, [score for batch in batches for score in batch]))
+            scores.update(fresh)
+            self.stats["pairs_scored"] += len(fresh)
+            with self._lock:
+                self._scores.update(fresh)
+                while len(self._scores) > self.max_entries:
+                    self._scores.popitem(last=False)
+
+        return [scores[key] for key in keys]
+
+    async def rerank_batch(self, questions: List[str], results: List[List[SearchResult]],
+                           top_n: int) -> List[List[SearchResult]]:
+        """Reorder each question's candidates by cross-encoder score and keep the best top_n.
+
+        On failure the candidates keep their retrieval order (cut to top_n).
+        """
+        if self._failed:
+            return [candidates[:top_n] for candidates in results]
+        pairs = [(question, result.content) for question, candidates in zip(questions, results) for result in candidates]
+        try:
+            scores = await self.score_pairs(pairs)
+        except Exception as e:
+            # A model that cannot be loaded will not load on the next request either
+            print(f"Warning: Reranking failed, using retrieval order: {e}")
+            self.stats["failures"] += 1
+            self._failed = self._model is None
+            return [candidates[:top_n] for candidates in results]
+
+        reranked = []
+        position = 0
+        for candidates in results:
+            scored = []
+            for result in candidates:
+                score = scores[position]
+                position += 1
+                scored.append(result.model_copy(update={"score": score, "scores": {**result.scores, "rerank": score}}))
+            scored.sort(key=lambda result: result.score, reverse=True)
+            reranked.append(scored[:top_n])
+        return reranked
+
+    def get_info(self) -> Dict[str, object]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "model": self.model_name,
+            "loaded": self._model is not None,
+            "entries": len(self._scores),
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            **self.stats
+        }
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,118 @@
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional
+import numpy as np
+from config import settings
+
+class _DocumentEntries:
+    """Question vectors and answers for one document, stored as a ring buffer.
+
+    The vector matrix starts small and doubles as entries are added, up to
+    capacity rows, so documents with few cached questions stay cheap.
+    """
+
+    INITIAL_ROWS = 8
+
+    def __init__(self, capacity: int, dimension: int):
+        self.capacity = capacity
+        self.vectors = np.zeros((min(capacity, self.INITIAL_ROWS), dimension), dtype=np.float32)
+        self.questions: List[Optional[str]] = []
+        self.answers: List[Optional[str]] = []
+        self.size = 0
+        self.next_slot = 0
+
+    def add(self, vector: np.ndarray, question: str, answer: str):
+        """Store an entry, overwriting the oldest one once capacity is reached"""
+        slot = self.next_slot
+        if slot == len(self.vectors) and slot < self.capacity:
+            grown = np.zeros((min(self.capacity, 2 * len(self.vectors)), self.vectors.shape[1]), dtype=np.float32)
+            grown[:slot] = self.vectors
+            self.vectors = grown
+        self.vectors[slot] = vector
+        if slot == len(self.questions):
+            self.questions.append(question)
+            self.answers.append(answer)
+        else:
+            self.questions[slot] = question
+            self.answers[slot] = answer
+        self.next_slot = (slot + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+class SemanticCache:
+    """Reuses answers for paraphrased questions about the same document.
+
+    Each document scope holds a small matrix of normalized question
+    embeddings. A lookup is one matrix product against it; the best match at
+    or above settings.semantic_cache_threshold (cosine) returns its stored
+    answer. Each scope keeps at most semantic_cache_max_per_document entries
+    (oldest overwritten first) and at most semantic_cache_max_documents
+    scopes are kept (least recently used dropped).
+    """
+
+    def __init__(self):
+        self.threshold = settings.semantic_cache_threshold
+        self.max_per_document = settings.semantic_cache_max_per_document
+        self.max_documents = settings.semantic_cache_max_documents
+        self._documents: "OrderedDict[str, _DocumentEntries]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def lookup_many(self, scope: str, vectors: np.ndarray) -> List[Optional[str]]:
+        """Return the cached answer (or None) for each question vector"""
+        vectors = self._normalize(vectors)
+        with self._lock:
+            entries = self._documents.get(scope)
+            if entries is None or entries.size == 0 or entries.vectors.shape[1] != vectors.shape[1]:
+                self.stats["misses"] += len(vectors)
+                return [None] * len(vectors)
+            self._documents.move_to_end(scope)
+
+            similarities = vectors @ entries.vectors[:entries.size].T
+            best = similarities.argmax(axis=1)
+            answers = []
+            for row, slot in enumerate(best):
+                if similarities[row, slot] >= self.threshold:
+                    answers.append(entries.answers[slot])
+                    self.stats["hits"] += 1
+                else:
+                    answers.append(None)
+                    self.stats["misses"] += 1
+            return answers
+
+    def add_many(self, scope: str, vectors: np.ndarray, questions: List[str], answers: List[str]):
+        """Store answered questions under a document scope"""
+        if len(questions) == 0:
+            return
+        vectors = self._normalize(vectors)
+        with self._lock:
+            entries = self._documents.get(scope)
+            if entries is None or entries.vectors.shape[1] != vectors.shape[1]:
+                entries = _DocumentEntries(self.max_per_document, vectors.shape[1])
+                self._documents[scope] = entries
+            self._documents.move_to_end(scope)
+            while len(self._documents) > self.max_documents:
+                self._documents.popitem(last=False)
+                self.stats["evictions"] += 1
+
+            for vector, question, answer in zip(vectors, questions, answers):
+                if entries.size == self.max_per_document:
+                    self.stats["evictions"] += 1
+                entries.add(vector, question, answer)
+                self.stats["writes"] += 1
+
+    def get_info(self) -> Dict[str, object]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "documents": len(self._documents),
+            "entries": sum(entries.size for entries in self._documents.values()),
+            "threshold": self.threshold,
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            **self.stats
+        }
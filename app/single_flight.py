@@ -0,0 +1,48 @@
+import asyncio
+import contextvars
+from typing import Any, Awaitable, Callable, Dict
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one execution.
+
+    The first caller for a key starts the work as a background task; callers
+    arriving while it is in flight await the same task. Work is shielded, so
+    a cancelled caller (e.g. a disconnected client) does not abort it for the
+    others, and runs in an empty context rather than the first caller's.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.stats = {
+            "calls": 0,
+            "executions": 0,
+            "coalesced": 0,
+            "failures": 0
+        }
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fn() once per key at a time and share its result with all callers"""
+        self.stats["calls"] += 1
+        task = self._inflight.get(key)
+        if task is None:
+            self.stats["executions"] += 1
+            # The shared work must not inherit the first caller's context (e.g. its request trace)
+            task = asyncio.get_running_loop().create_task(fn(), context=contextvars.Context())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        else:
+            self.stats["coalesced"] += 1
+        return await asyncio.shield(task)
+
+    def in_flight(self) -> int:
+        """Number of keys currently being processed"""
+        return len(self._inflight)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {**self.stats, "in_flight": self.in_flight()}
+
+    def _finish(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if task.cancelled() or task.exception() is not None:
+            self.stats["failures"] += 1
@@ -0,0 +1,45 @@
+import re
+from config import settings
+
+# Approximation used when tiktoken is not installed: words and punctuation marks
+APPROX_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+_encoding = None
+_encoding_loaded = False
+
+def _get_encoding():
+    """Load the tiktoken encoding once; None if tiktoken is unavailable"""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(settings.tokenizer_encoding)
+        except Exception as e:
+            print(f"Warning: tiktoken unavailable ({e}), approximating token counts")
+            _encoding = None
+    return _encoding
+
+def count_tokens(text: str) -> int:
+    """Number of model tokens in text (approximate without tiktoken)"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return sum(1 + len(piece) // 8 for piece in APPROX_TOKEN_PATTERN.findall(text))
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Longest prefix of text that fits in max_tokens"""
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+    used = 0
+    for match in APPROX_TOKEN_PATTERN.finditer(text):
+        used += 1 + len(match.group(0)) // 8
+        if used > max_tokens:
+            return text[:match.start()].rstrip()
+    return text
@@ -1,16 +1,60 @@
 import pinecone
-import openai
-from typing import List, Dict, Any
+import hashlib
+import os
+import re
+from collections import OrderedDict
+from typing import AsyncIterator, List, Dict, Any, Optional
+import numpy as np
 from app.models import DocumentChunk, SearchResult
+from app.embedding_service import EmbeddingService
+from app.local_index import LocalVectorIndex
+from app.fallback_search import FallbackSearch
+from app.document_processor import chunking_signature
+from app.metrics import timed
 from config import settings
 import asyncio
 import time
 
+DEFAULT_NAMESPACE = "default"
+
 class VectorStore:
     def __init__(self):
         self.index = None
-        self.fallback_search = None
-        self.initialize_pinecone()
+        self.local_index = None
+        self.lexical_indexes: "OrderedDict[str, FallbackSearch]" = OrderedDict()
+        self._ingested_namespaces = set()
+        self.embedding_service = EmbeddingService()
+        
+        # Backend selection: Pinecone, then the local index, then keyword fallback
+        if settings.vector_backend in ("auto", "pinecone"):
+            self.initialize_pinecone()
+        if self.index is None and settings.vector_backend in ("auto", "local"):
+            self.initialize_local_index()
+    
+    def initialize_local_index(self):
+        """Initialize the in-process vector index"""
+        if not self.embedding_service.is_available():
+            print("Warning: No embedding provider available for local index. Using fallback search.")
+            return
+        self.local_index = LocalVectorIndex(
+            embedding_model=f"{self.embedding_service.provider}:{self.embedding_service.model}",
+            chunking=chunking_signature()
+        )
+        print(f"✅ Using local vector index ({settings.local_index_metric}, {self.embedding_service.model})")
+    
+    @staticmethod
+    def content_id(content: str) -> str:
+        """Deterministic id derived from chunk content"""
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()[:32]
+    
+    @classmethod
+    def chunk_id(cls, chunk: DocumentChunk) -> str:
+        return cls.content_id(chunk.content)
+    
+    def _pinecone_namespace(self, namespace: str) -> str:
+        """Pinecone namespace for a document, keyed by the chunking and embedding model that filled it"""
+        signature = f"{chunking_signature()}|{self.embedding_service.provider}:{self.embedding_service.model}"
+        return f"{namespace}-{hashlib.sha256(signature.encode('utf-8')).hexdigest()[:8]}"
     
     def initialize_pinecone(self):
         """Initialize Pinecone connection"""
@@ -52,104 +96,452 @@ class VectorStore:
             print(f"Warning: Pinecone initialization failed: {e}. Using fallback search.")
     
     async def get_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """Get embeddings for text using OpenAI"""
+        """Get embeddings for text using the batched, cached embedding service"""
         try:
-            if not settings.openai_api_key:
-                raise Exception("OpenAI API key not provided")
-            
-            client = openai.OpenAI(api_key=settings.openai_api_key)
-            
-            embeddings = []
-            for text in texts:
-                response = client.embeddings.create(
-                    model=settings.embedding_model,
-                    input=text
-                )
-                embeddings.append(response.data[0].embedding)
-            
-            return embeddings
+            embeddings = await self.embedding_service.embed(texts)
+            return embeddings.tolist()
         except Exception as e:
             raise Exception(f"Failed to get embeddings: {str(e)}")
     
-    async def store_documents(self, chunks: List[DocumentChunk]) -> bool:
-        """Store document chunks in vector database"""
-        try:
-            if not self.index:
+    def has_dense_backend(self) -> bool:
+        return self.local_index is not None or self.index is not None
+    
+    def uses_query_embeddings(self) -> bool:
+        """Whether retrieval embeds the queries (so they can be embedded ahead of time)"""
+        return settings.retrieval_mode != "lexical" and self.has_dense_backend()
+    
+    async def store_documents(self, chunks: List[DocumentChunk], namespace: Optional[str] = None) -> bool:
+        """Store document chunks in the dense and/or lexical indexes"""
+        namespace = namespace or DEFAULT_NAMESPACE
+        mode = settings.retrieval_mode
+        
+        if not self.has_dense_backend() or mode == "lexical":
+            if not self.has_dense_backend():
                 print("Warning: Using fallback storage (no vector database)")
-                # Initialize fallback search
-                from app.fallback_search import FallbackSearch
-                self.fallback_search = FallbackSearch()
-                self.fallback_search.add_documents(chunks)
-                return True
-            
-            # Get embeddings for chunks
-            texts = [chunk.content for chunk in chunks]
-            embeddings = await self.get_embeddings(texts)
-            
-            # Prepare vectors for Pinecone
-            vectors = []
-            for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-                vector = {
-                    "id": f"chunk_{i}_{int(time.time())}",
-                    "values": embedding,
-                    "metadata": {
-                        "content": chunk.content,
-                        **chunk.metadata
-                    }
-                }
-                vectors.append(vector)
-            
-            # Upsert to Pinecone
-            self.index.upsert(vectors=vectors)
-            print(f"✅ Stored {len(vectors)} chunks in Pinecone")
+            await self._index_lexical(chunks, namespace)
+            return True
+        
+        if mode == "hybrid":
+            # Lexical indexing is CPU-only and overlaps with embedding round trips
+            dense_result, lexical_result = await asyncio.gather(
+                self._store_dense(chunks, namespace),
+                self._index_lexical(chunks, namespace),
+                return_exceptions=True
+            )
+            if isinstance(lexical_result, Exception):
+                # Hybrid search keeps working on the dense side alone
+                print(f"Warning: Lexical indexing failed: {lexical_result}")
+            if isinstance(dense_result, Exception):
+                print(f"Warning: Vector storage failed: {dense_result}")
+                return False
+            return True
+        
+        try:
+            await self._store_dense(chunks, namespace)
             return True
-            
         except Exception as e:
             print(f"Warning: Vector storage failed: {e}")
-            # Initialize fallback search
-            from app.fallback_search import FallbackSearch
-            self.fallback_search = FallbackSearch()
-            self.fallback_search.add_documents(chunks)
+            await self._index_lexical(chunks, namespace)
             return False
     
-    async def search_similar(self, query: str, top_k: int = 5) -> List[SearchResult]:
-        """Search for similar documents using vector similarity"""
+    async def store_documents_stream(self, batches: AsyncIterator[List[DocumentChunk]],
+                                     namespace: Optional[str] = None) -> List[DocumentChunk]:
+        """Index chunk batches as they are produced and return all chunks.
+        
+        Each batch is embedded and upserted while the next one is still
+        being extracted, so the first chunks are searchable-ready long before
+        the document is fully parsed. The lexical index needs corpus-wide
+        statistics and is built once the stream ends.
+        """
+        namespace = namespace or DEFAULT_NAMESPACE
+        mode = settings.retrieval_mode
+        use_dense = self.has_dense_backend() and mode != "lexical"
+        dense = use_dense and not self._dense_namespace_ready(namespace)
+        # A Pinecone namespace left by an earlier process can only be checked
+        # against the full chunk count, so hold its batches until the stream ends
+        deferred = dense and self.local_index is None and await self._namespace_vector_count(namespace) > 0
+        if use_dense and not dense:
+            print("✅ Document already in vector index")
+        
+        started = time.perf_counter()
+        chunks: List[DocumentChunk] = []
+        pending: List[asyncio.Task] = []
+        dense_error: Optional[Exception] = None
+        
+        async def index_batch(batch: List[DocumentChunk], first: bool):
+            await self._upsert_dense_batch(batch, namespace)
+            if first:
+                print(f"⏱️ First chunks indexed after {time.perf_counter() - started:.2f}s")
+        
         try:
-            if not self.index:
-                return await self._fallback_search(query, top_k)
-            
-            # Get query embedding
-            query_embedding = await self.get_embeddings([query])
-            
-            # Search in Pinecone
-            results = self.index.query(
-                vector=query_embedding[0],
-                top_k=top_k,
-                include_metadata=True
+            async for batch in batches:
+                chunks.extend(batch)
+                if dense and not deferred and dense_error is None:
+                    pending.append(asyncio.create_task(index_batch(batch, not pending)))
+                    # Bound the number of batches held in flight
+                    while len(pending) > settings.embedding_max_concurrency:
+                        try:
+                            await pending.pop(0)
+                        except Exception as e:
+                            dense_error = e
+        except BaseException:
+            for task in pending:
+                task.cancel()
+            if dense and self.local_index is not None:
+                self.local_index.delete_namespace(namespace)
+            raise
+        
+        for result in await asyncio.gather(*pending, return_exceptions=True):
+            if isinstance(result, Exception) and dense_error is None:
+                dense_error = result
+        
+        if deferred:
+            unique_ids = {self.chunk_id(chunk) for chunk in chunks}
+            if await self._namespace_populated(namespace, len(unique_ids)):
+                print("✅ Document already in vector index")
+                dense = False
+            else:
+                try:
+                    for start in range(0, len(chunks), settings.ingest_batch_size):
+                        await self._upsert_dense_batch(chunks[start:start + settings.ingest_batch_size], namespace)
+                except Exception as e:
+                    dense_error = e
+        
+        if dense:
+            if dense_error is not None:
+                print(f"Warning: Vector storage failed: {dense_error}")
+                if self.local_index is not None:
+                    self.local_index.delete_namespace(namespace)
+            elif self.local_index is not None:
+                await asyncio.to_thread(self.local_index.persist, namespace)
+                print(f"✅ Stored {len(chunks)} chunks in local index")
+            else:
+                self._ingested_namespaces.add(namespace)
+                print(f"✅ Stored {len(chunks)} chunks in Pinecone namespace {namespace[:12]}")
+        
+        if mode in ("lexical", "hybrid") or not use_dense or dense_error is not None:
+            if not self.has_dense_backend():
+                print("Warning: Using fallback storage (no vector database)")
+            await self._index_lexical(chunks, namespace)
+        return chunks
+    
+    def _dense_namespace_ready(self, namespace: str) -> bool:
+        if self.local_index is not None:
+            return self.local_index.has_namespace(namespace)
+        return namespace in self._ingested_namespaces
+    
+    async def _upsert_dense_batch(self, chunks: List[DocumentChunk], namespace: str):
+        """Embed one batch of chunks and add it to the dense backend (local index unsaved)"""
+        vectors_by_id = {}
+        for chunk in chunks:
+            vectors_by_id.setdefault(self.chunk_id(chunk), chunk)
+        ids = list(vectors_by_id)
+        embeddings = await self.embedding_service.embed([vectors_by_id[vector_id].content for vector_id in ids])
+        metadatas = [self._vector_metadata(vectors_by_id[vector_id], vector_id) for vector_id in ids]
+        
+        if self.local_index is not None:
+            with timed("vector_upsert"):
+                await asyncio.to_thread(self.local_index.upsert, namespace, ids, embeddings, metadatas, False)
+            return
+        
+        vectors = [
+            {"id": vector_id, "values": embedding, "metadata": metadata}
+            for vector_id, embedding, metadata in zip(ids, embeddings.tolist(), metadatas)
+        ]
+        batch_size = settings.pinecone_upsert_batch_size
+        for start in range(0, len(vectors), batch_size):
+            with timed("vector_upsert"):
+                await asyncio.to_thread(
+                    self.index.upsert, vectors=vectors[start:start + batch_size], namespace=self._pinecone_namespace(namespace)
+                )
+    
+    async def _store_dense(self, chunks: List[DocumentChunk], namespace: str):
+        if self.local_index is not None:
+            await self._store_local(chunks, namespace)
+        else:
+            await self._store_pinecone(chunks, namespace)
+    
+    async def _store_pinecone(self, chunks: List[DocumentChunk], namespace: str):
+        """Embed chunks and upsert them into the document's Pinecone namespace"""
+        # Ids are content hashes, so identical chunks collapse to one vector
+        vectors_by_id = {}
+        for chunk in chunks:
+            vectors_by_id.setdefault(self.chunk_id(chunk), chunk)
+        
+        if await self._namespace_populated(namespace, len(vectors_by_id)):
+            print("✅ Document already in Pinecone, skipping ingestion")
+            return
+        
+        # Get embeddings for chunks
+        ids = list(vectors_by_id)
+        embeddings = await self.get_embeddings([vectors_by_id[vector_id].content for vector_id in ids])
+        
+        # Prepare vectors for Pinecone
+        vectors = []
+        for vector_id, embedding in zip(ids, embeddings):
+            vectors.append({
+                "id": vector_id,
+                "values": embedding,
+                "metadata": self._vector_metadata(vectors_by_id[vector_id], vector_id)
+            })
+        
+        # Upsert to Pinecone in bounded parallel batches
+        batch_size = settings.pinecone_upsert_batch_size
+        semaphore = asyncio.Semaphore(settings.pinecone_upsert_concurrency)
+        
+        async def upsert_batch(batch):
+            async with semaphore:
+                with timed("vector_upsert"):
+                    await asyncio.to_thread(self.index.upsert, vectors=batch, namespace=self._pinecone_namespace(namespace))
+        
+        await asyncio.gather(*[
+            upsert_batch(vectors[start:start + batch_size])
+            for start in range(0, len(vectors), batch_size)
+        ])
+        self._ingested_namespaces.add(namespace)
+        print(f"✅ Stored {len(vectors)} chunks in Pinecone namespace {namespace[:12]}")
+    
+    async def _namespace_populated(self, namespace: str, expected_count: int) -> bool:
+        """Check whether a Pinecone namespace already holds every vector of a document"""
+        if namespace in self._ingested_namespaces:
+            return True
+        if await self._namespace_vector_count(namespace) >= expected_count:
+            self._ingested_namespaces.add(namespace)
+            return True
+        return False
+    
+    async def _namespace_vector_count(self, namespace: str) -> int:
+        """Number of vectors Pinecone reports for a namespace (0 if absent or unreadable)"""
+        try:
+            stats = await asyncio.to_thread(self.index.describe_index_stats)
+            namespaces = getattr(stats, "namespaces", None)
+            if namespaces is None:
+                namespaces = stats.get("namespaces", {})
+            summary = namespaces.get(self._pinecone_namespace(namespace))
+            if summary is None:
+                return 0
+            count = getattr(summary, "vector_count", None)
+            if count is None:
+                count = summary.get("vector_count", 0)
+            return count
+        except Exception as e:
+            print(f"Warning: Could not read Pinecone namespace stats: {e}")
+        return 0
+    
+    def _vector_metadata(self, chunk: DocumentChunk, vector_id: str) -> Dict[str, Any]:
+        """Metadata stored alongside each vector"""
+        return {"content": chunk.content, "vector_id": vector_id, **chunk.metadata}
+    
+    async def _store_local(self, chunks: List[DocumentChunk], namespace: str):
+        """Embed chunks and add them to the local index (skipped when already indexed)"""
+        if self.local_index.has_namespace(namespace):
+            print("✅ Document already in local index")
+            return
+        
+        embeddings = await self.embedding_service.embed([chunk.content for chunk in chunks])
+        ids = [self.chunk_id(chunk) for chunk in chunks]
+        metadatas = [self._vector_metadata(chunk, vector_id) for chunk, vector_id in zip(chunks, ids)]
+        with timed("vector_upsert"):
+            await asyncio.to_thread(self.local_index.upsert, namespace, ids, embeddings, metadatas)
+        print(f"✅ Stored {len(ids)} chunks in local index")
+    
+    async def search_similar(self, query: str, top_k: int = 5, namespace: Optional[str] = None) -> List[SearchResult]:
+        """Search for relevant chunks using the configured retrieval mode"""
+        return (await self.search_similar_batch([query], top_k, namespace))[0]
+    
+    async def search_similar_batch(self, queries: List[str], top_k: int = 5, namespace: Optional[str] = None,
+                                   query_embeddings: Optional[np.ndarray] = None) -> List[List[SearchResult]]:
+        """Search for several queries at once, returning one result list per query.
+        
+        Identical queries are searched once. Dense retrieval embeds all
+        queries in a single call (or uses query_embeddings, one row per
+        query, when the caller embedded them already), then scores them
+        together: one matrix product on the local index, concurrent queries
+        on Pinecone.
+        """
+        namespace = namespace or DEFAULT_NAMESPACE
+        unique = list(dict.fromkeys(queries))
+        if query_embeddings is not None:
+            rows = {}
+            for row, query in enumerate(queries):
+                rows.setdefault(query, row)
+            query_embeddings = query_embeddings[[rows[query] for query in unique]]
+        with timed("retrieval"):
+            results = await self._search_batch(unique, top_k, namespace, query_embeddings)
+        by_query = dict(zip(unique, results))
+        return [list(by_query[query]) for query in queries]
+    
+    async def _search_batch(self, queries: List[str], top_k: int, namespace: str,
+                            query_embeddings: Optional[np.ndarray] = None) -> List[List[SearchResult]]:
+        mode = settings.retrieval_mode
+        
+        if mode == "lexical" or not self.has_dense_backend():
+            return await self._fallback_search_batch(queries, top_k, namespace)
+        
+        if mode == "hybrid":
+            candidates = max(top_k, settings.hybrid_candidates)
+            dense_results, lexical_results = await asyncio.gather(
+                self._dense_search_batch(queries, candidates, namespace, query_embeddings),
+                self._fallback_search_batch(queries, candidates, namespace),
+                return_exceptions=True
             )
+            if isinstance(dense_results, Exception):
+                print(f"Warning: Vector search failed: {dense_results}")
+                dense_results = [[] for _ in queries]
+            if isinstance(lexical_results, Exception):
+                print(f"Warning: Lexical search failed: {lexical_results}")
+                lexical_results = [[] for _ in queries]
+            return [
+                self.fuse_results({"dense": dense, "lexical": lexical}, top_k)
+                for dense, lexical in zip(dense_results, lexical_results)
+            ]
+        
+        try:
+            results = await self._dense_search_batch(queries, top_k, namespace, query_embeddings)
+        except Exception as e:
+            print(f"Warning: Vector search failed: {e}")
+            return await self._fallback_search_batch(queries, top_k, namespace)
+        if not any(results):
+            # A failed dense ingest leaves the namespace missing or empty; its BM25 index was built instead
+            print("Warning: No vector matches, using lexical search")
+            return await self._fallback_search_batch(queries, top_k, namespace)
+        return results
+    
+    async def _dense_search_batch(self, queries: List[str], top_k: int, namespace: str,
+                                  query_embeddings: Optional[np.ndarray] = None) -> List[List[SearchResult]]:
+        """Search the local index or Pinecone by embedding similarity, embedding all queries in one call"""
+        if query_embeddings is None:
+            query_embeddings = await self.embedding_service.embed(queries)
+        
+        if self.local_index is not None:
+            with timed("vector_query"):
+                batch = self.local_index.query_batch(namespace, query_embeddings, top_k)
+        else:
+            semaphore = asyncio.Semaphore(settings.pinecone_query_concurrency)
             
-            # Convert to SearchResult objects
-            search_results = []
-            for match in results.matches:
-                search_results.append(SearchResult(
-                    content=match.metadata.get("content", ""),
-                    score=match.score,
-                    metadata=match.metadata
-                ))
+            async def query_pinecone(vector: List[float]) -> List[SearchResult]:
+                # Search in Pinecone, scoped to the document's namespace
+                async with semaphore:
+                    with timed("vector_query"):
+                        response = await asyncio.to_thread(
+                            self.index.query,
+                            vector=vector,
+                            top_k=top_k,
+                            include_metadata=True,
+                            namespace=self._pinecone_namespace(namespace)
+                        )
+                
+                # Convert to SearchResult objects
+                return [
+                    SearchResult(content=match.metadata.get("content", ""), score=match.score, metadata=match.metadata)
+                    for match in response.matches
+                ]
             
-            return search_results
+            batch = await asyncio.gather(*[query_pinecone(vector) for vector in query_embeddings.tolist()])
+        
+        for results in batch:
+            for result in results:
+                result.scores = {"dense": result.score}
+        return list(batch)
+    
+    def fuse_results(self, sources: Dict[str, List[SearchResult]], top_k: int) -> List[SearchResult]:
+        """Merge ranked lists from several indexes, deduplicating chunks by id.
+        
+        "rrf" sums 1 / (k + rank) over sources; "weighted" sums min-max
+        normalized scores weighted by hybrid_dense_weight. Each result keeps
+        the raw score from every source that returned it.
+        """
+        fused: Dict[str, SearchResult] = {}
+        totals: Dict[str, float] = {}
+        
+        for source, results in sources.items():
+            if not results:
+                continue
+            if settings.hybrid_fusion == "weighted":
+                weight = settings.hybrid_dense_weight if source == "dense" else 1 - settings.hybrid_dense_weight
+                raw = [result.score for result in results]
+                low, high = min(raw), max(raw)
+                span = (high - low) or 1.0
             
-        except Exception as e:
-            print(f"Warning: Vector search failed: {e}")
-            return await self._fallback_search(query, top_k)
+            for rank, result in enumerate(results):
+                result_id = result.metadata.get("vector_id") or self.content_id(result.content)
+                if settings.hybrid_fusion == "weighted":
+                    contribution = weight * ((result.score - low) / span if high > low else 1.0)
+                else:
+                    contribution = 1.0 / (settings.hybrid_rrf_k + rank + 1)
+                
+                if result_id not in fused:
+                    fused[result_id] = SearchResult(
+                        content=result.content,
+                        score=0.0,
+                        metadata=result.metadata,
+                        scores={}
+                    )
+                    totals[result_id] = 0.0
+                fused[result_id].scores[source] = result.score
+                totals[result_id] += contribution
+        
+        ranked = sorted(fused, key=lambda result_id: totals[result_id], reverse=True)[:top_k]
+        results = []
+        for result_id in ranked:
+            result = fused[result_id]
+            result.score = totals[result_id]
+            results.append(result)
+        return results
     
-    async def _fallback_search(self, query: str, top_k: int) -> List[SearchResult]:
-        """Fallback search using simple text matching"""
-        from app.fallback_search import FallbackSearch
+    async def _index_lexical(self, chunks: List[DocumentChunk], namespace: str):
+        """Build (or load the persisted) BM25 index for a document"""
+        if self._get_lexical(namespace) is not None:
+            return
+        
+        def build():
+            index = FallbackSearch()
+            index.add_documents(chunks)
+            try:
+                index.save(self._lexical_path(namespace))
+            except Exception as e:
+                print(f"Warning: Failed to persist lexical index: {e}")
+            return index
         
-        # Use fallback search if available
-        if hasattr(self, 'fallback_search') and self.fallback_search:
-            return self.fallback_search.search(query, top_k)
+        with timed("lexical_index"):
+            index = await asyncio.to_thread(build)
+        self._remember_lexical(namespace, index)
+    
+    def _get_lexical(self, namespace: str) -> Optional[FallbackSearch]:
+        """Return the BM25 index for a namespace from memory or disk"""
+        index = self.lexical_indexes.get(namespace)
+        if index is not None:
+            self.lexical_indexes.move_to_end(namespace)
+            return index
+        index = FallbackSearch.load(self._lexical_path(namespace))
+        if index is not None:
+            self._remember_lexical(namespace, index)
+        return index
+    
+    def _remember_lexical(self, namespace: str, index: FallbackSearch):
+        self.lexical_indexes[namespace] = index
+        self.lexical_indexes.move_to_end(namespace)
+        while len(self.lexical_indexes) > settings.lexical_index_max_documents:
+            self.lexical_indexes.popitem(last=False)
+    
+    def _lexical_path(self, namespace: str) -> str:
+        safe_name = re.sub(r'[^A-Za-z0-9_.-]', '_', namespace)
+        # Keyed by the chunking signature so a chunker change never loads stale chunks
+        signature = hashlib.sha256(chunking_signature().encode("utf-8")).hexdigest()[:8]
+        return os.path.join(settings.cache_dir, "lexical", f"{safe_name}-{signature}.npz")
+    
+    async def _fallback_search_batch(self, queries: List[str], top_k: int, namespace: str) -> List[List[SearchResult]]:
+        return [await self._fallback_search(query, top_k, namespace) for query in queries]
+    
+    async def _fallback_search(self, query: str, top_k: int, namespace: Optional[str] = None) -> List[SearchResult]:
+        """Fallback search using the document's BM25 index"""
+        index = self._get_lexical(namespace or DEFAULT_NAMESPACE)
+        if index is not None:
+            with timed("lexical_search"):
+                results = index.search(query, top_k)
+            for result in results:
+                result.scores = {"lexical": result.score}
+            return results
         
         # Return empty results if no fallback available
         return []
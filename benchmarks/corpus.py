@@ -0,0 +1,120 @@
+"""
+Synthetic policy documents for benchmarks: PDFs written without extra
+dependencies and DOCX files via python-docx.
+"""
+
+import io
+import random
+import textwrap
+from typing import Dict, List
+
+TOPICS = [
+    ("Grace Period", "A grace period of {n} days is allowed for payment of the renewal premium without loss of continuity benefits."),
+    ("Pre-existing Diseases", "Pre-existing diseases are covered after a waiting period of {n} months of continuous coverage since inception."),
+    ("Maternity", "Maternity expenses are covered after {n} months of continuous coverage, limited to two deliveries during the policy period."),
+    ("Cataract Surgery", "Cataract surgery is covered after a waiting period of {n} months, subject to the limit stated in the schedule."),
+    ("Organ Donor", "Medical expenses for the hospitalisation of an organ donor are covered up to {n} percent of the sum insured."),
+    ("No Claim Discount", "A no claim discount of {n} percent on the base premium is offered on renewal for each claim-free year."),
+    ("Health Check-up", "Expenses for a preventive health check-up are reimbursed at the end of every block of {n} continuous policy years."),
+    ("AYUSH Treatment", "In-patient AYUSH treatment is covered up to the sum insured when taken in an AYUSH hospital for at least {n} hours."),
+    ("Room Rent", "Room rent is limited to {n} percent of the sum insured per day, and ICU charges to twice that amount."),
+    ("Hospital Definition", "A hospital means an institution with at least {n} in-patient beds, qualified nursing staff and a fully equipped operation theatre."),
+]
+
+FILLER = [
+    "The insured person shall comply with all terms and conditions of this policy.",
+    "Claims must be intimated to the company within the time limit stated in the schedule.",
+    "All documents requested by the company shall be submitted in original where required.",
+    "The company may appoint a third party administrator to process claims under this policy.",
+    "Any dispute regarding the quantum of a claim shall be referred to arbitration.",
+    "The policy is renewable for life subject to payment of premium and absence of fraud.",
+    "Disclosure of material facts is a condition precedent to the company's liability.",
+    "Benefits are subject to the sum insured and any sub-limits mentioned in the schedule.",
+]
+
+QUESTIONS = [
+    "What is the grace period for premium payment?",
+    "What is the waiting period for pre-existing diseases?",
+    "Does this policy cover maternity expenses, and what are the conditions?",
+    "What is the waiting period for cataract surgery?",
+    "Are the medical expenses for an organ donor covered?",
+    "What is the no claim discount offered?",
+    "Is there a benefit for preventive health check-ups?",
+    "How does the policy cover AYUSH treatments?",
+    "Are there sub-limits on room rent and ICU charges?",
+    "How does the policy define a hospital?",
+]
+
+def policy_pages(seed: int, pages: int) -> List[str]:
+    """Page texts of a synthetic policy with numbered sections"""
+    rng = random.Random(seed)
+    result = []
+    section = 0
+    for page in range(pages):
+        lines = []
+        for _ in range(3):
+            section += 1
+            title, clause = TOPICS[(section - 1) % len(TOPICS)]
+            lines.append(f"{section}. {title}")
+            paragraph = clause.format(n=rng.choice([15, 24, 30, 36, 48, 90]))
+            paragraph += " " + " ".join(rng.sample(FILLER, 4))
+            lines.extend(textwrap.wrap(paragraph, 90))
+            lines.append("")
+        lines.append(f"Policy wording - page {page + 1} of {pages} - reference {seed}")
+        result.append("\n".join(lines))
+    return result
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def make_pdf(pages: List[str]) -> bytes:
+    """Write a minimal PDF with one Helvetica text page per entry"""
+    objects: List[bytes] = []
+    page_ids = [4 + 2 * i for i in range(len(pages))]
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for page_id, text in zip(page_ids, pages):
+        lines = " T* ".join(f"({_pdf_escape(line)}) Tj" for line in text.split("\n"))
+        stream = f"BT /F1 10 Tf 12 TL 50 760 Td {lines} ET".encode("latin-1", "replace")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>".encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+def make_docx(pages: List[str]) -> bytes:
+    """Write the page texts as DOCX paragraphs"""
+    from docx import Document
+    document = Document()
+    for text in pages:
+        for line in text.split("\n"):
+            document.add_paragraph(line)
+    out = io.BytesIO()
+    document.save(out)
+    return out.getvalue()
+
+def build_corpus(documents: int, pages: int, docx_every: int = 4) -> Dict[str, bytes]:
+    """Map of file name to content: policy-<i>.pdf, with every docx_every-th one as DOCX"""
+    corpus = {}
+    for i in range(documents):
+        page_texts = policy_pages(seed=i, pages=pages)
+        if docx_every and i % docx_every == docx_every - 1:
+            corpus[f"policy-{i}.docx"] = make_docx(page_texts)
+        else:
+            corpus[f"policy-{i}.pdf"] = make_pdf(page_texts)
+    return corpus
@@ -0,0 +1,245 @@
+"""
+Local stand-ins for the external services the pipeline calls, with
+configurable latency:
+
+- GET  /docs/{name}                      document corpus (ETag / 304 aware)
+- POST /v1/embeddings                    OpenAI-compatible embeddings
+- POST /v1/chat/completions              OpenAI-compatible chat (also under /openai for Groq)
+- POST /pinecone/vectors/upsert, /pinecone/query, /pinecone/describe_index_stats
+
+Run standalone with: python -m benchmarks.fake_services --port 9100
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import numpy as np
+import requests
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import StreamingResponse
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+")
+
+@dataclass
+class Latency:
+    """Simulated service latencies in seconds"""
+    llm: float = 0.4
+    llm_jitter: float = 0.1
+    llm_token: float = 0.0  # Extra delay per streamed token
+    embedding: float = 0.05
+    vector: float = 0.01
+    download: float = 0.05
+
+def fake_embedding(text: str, dimension: int) -> np.ndarray:
+    """Hashed bag-of-words vector, so similar texts get similar embeddings"""
+    vector = np.zeros(dimension, dtype=np.float32)
+    for word in WORD_PATTERN.findall(text.lower()):
+        bucket = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=4).digest(), "little")
+        vector[bucket % dimension] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def fake_answer(prompt: str) -> str:
+    """Pick the context sentence sharing most words with the question"""
+    packed = re.search(r"JSON array of (\d+) strings", prompt)
+    if packed:
+        return json.dumps([f"Answer {i + 1} from the policy context." for i in range(int(packed.group(1)))])
+    question = prompt.rsplit("Question:", 1)[-1]
+    context = prompt.rsplit("Question:", 1)[0]
+    question_words = set(WORD_PATTERN.findall(question.lower()))
+    sentences = [s for s in SENTENCE_PATTERN.split(context) if len(s) > 20] or ["No relevant information found."]
+    return max(sentences, key=lambda s: len(question_words & set(WORD_PATTERN.findall(s.lower())))).strip()
+
+def create_app(corpus: Dict[str, bytes], latency: Latency, dimension: int = 256) -> FastAPI:
+    app = FastAPI(title="Benchmark stand-in services")
+    namespaces: Dict[str, Dict[str, object]] = {}
+    stats = {"documents": 0, "embeddings": 0, "completions": 0, "upserts": 0, "queries": 0}
+
+    async def llm_delay():
+        await asyncio.sleep(max(0.0, latency.llm + random.uniform(-latency.llm_jitter, latency.llm_jitter)))
+
+    @app.get("/docs/{name}")
+    async def document(name: str, request: Request):
+        content = corpus.get(name)
+        if content is None:
+            return Response(status_code=404)
+        await asyncio.sleep(latency.download)
+        stats["documents"] += 1
+        etag = '"' + hashlib.sha256(content).hexdigest()[:16] + '"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        media_type = "application/pdf" if name.endswith(".pdf") else \
+            "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+        return Response(content, media_type=media_type, headers={"ETag": etag})
+
+    @app.post("/v1/embeddings")
+    @app.post("/openai/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        await asyncio.sleep(latency.embedding)
+        stats["embeddings"] += len(inputs)
+        tokens = sum(len(text.split()) for text in inputs)
+        return {
+            "object": "list",
+            "model": body.get("model", "fake-embedding"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": fake_embedding(text, dimension).tolist()}
+                for i, text in enumerate(inputs)
+            ],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+        }
+
+    @app.post("/v1/chat/completions")
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        prompt = body["messages"][-1]["content"]
+        answer = fake_answer(prompt)
+        stats["completions"] += 1
+        usage = {
+            "prompt_tokens": sum(len(m["content"]) for m in body["messages"]) // 4,
+            "completion_tokens": len(answer) // 4,
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        base = {"id": f"chatcmpl-{time.time_ns()}", "created": int(time.time()), "model": body.get("model", "fake")}
+        await llm_delay()
+
+        if body.get("stream"):
+            async def events():
+                for piece in re.findall(r"\S+\s*", answer):
+                    chunk = {**base, "object": "chat.completion.chunk",
+                             "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                    if latency.llm_token:
+                        await asyncio.sleep(latency.llm_token)
+                done = {**base, "object": "chat.completion.chunk",
+                        "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+                yield f"data: {json.dumps(done)}\n\n"
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    yield f"data: {json.dumps({**base, 'object': 'chat.completion.chunk', 'choices': [], 'usage': usage})}\n\n"
+                yield "data: [DONE]\n\n"
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        return {
+            **base,
+            "object": "chat.completion",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+            "usage": usage
+        }
+
+    @app.post("/pinecone/vectors/upsert")
+    async def upsert(request: Request):
+        body = await request.json()
+        await asyncio.sleep(latency.vector)
+        namespace = namespaces.setdefault(body.get("namespace", ""), {})
+        for vector in body["vectors"]:
+            namespace[vector["id"]] = (np.asarray(vector["values"], dtype=np.float32), vector.get("metadata", {}))
+        stats["upserts"] += len(body["vectors"])
+        return {"upsertedCount": len(body["vectors"])}
+
+    @app.post("/pinecone/query")
+    async def query(request: Request):
+        body = await request.json()
+        await asyncio.sleep(latency.vector)
+        stats["queries"] += 1
+        namespace = namespaces.get(body.get("namespace", ""), {})
+        if not namespace:
+            return {"matches": []}
+        ids = list(namespace)
+        matrix = np.vstack([namespace[vector_id][0] for vector_id in ids])
+        query_vector = np.asarray(body["vector"], dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query_vector) or 1.0)
+        scores = matrix @ query_vector / np.where(norms == 0, 1.0, norms)
+        top = np.argsort(-scores)[:body.get("topK", 5)]
+        return {"matches": [
+            {"id": ids[i], "score": float(scores[i]),
+             "metadata": namespace[ids[i]][1] if body.get("includeMetadata") else {}}
+            for i in top
+        ]}
+
+    @app.post("/pinecone/describe_index_stats")
+    async def describe_index_stats():
+        await asyncio.sleep(latency.vector)
+        return {"namespaces": {name: {"vector_count": len(vectors)} for name, vectors in namespaces.items()}}
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+class FakePineconeIndex:
+    """Synchronous Pinecone Index look-alike backed by the stand-in service"""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/") + "/pinecone"
+        self.session = requests.Session()
+
+    def upsert(self, vectors: List[Dict[str, object]], namespace: str = ""):
+        response = self.session.post(f"{self.base_url}/vectors/upsert", json={"vectors": vectors, "namespace": namespace})
+        response.raise_for_status()
+        return response.json()
+
+    def query(self, vector: List[float], top_k: int = 5, include_metadata: bool = False, namespace: str = ""):
+        response = self.session.post(f"{self.base_url}/query", json={
+            "vector": vector, "topK": top_k, "includeMetadata": include_metadata, "namespace": namespace
+        })
+        response.raise_for_status()
+        return SimpleNamespace(matches=[SimpleNamespace(**match) for match in response.json()["matches"]])
+
+    def describe_index_stats(self):
+        response = self.session.post(f"{self.base_url}/describe_index_stats", json={})
+        response.raise_for_status()
+        return response.json()
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class ServiceThread:
+    """Runs an ASGI app under uvicorn on a background thread"""
+
+    def __init__(self, app: FastAPI, port: Optional[int] = None):
+        self.port = port or free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def start(self) -> "ServiceThread":
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.02)
+        return self
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+if __name__ == "__main__":
+    from benchmarks.corpus import build_corpus
+
+    parser = argparse.ArgumentParser(description="Serve the benchmark stand-in services")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--documents", type=int, default=8)
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--llm-latency", type=float, default=Latency.llm)
+    parser.add_argument("--embedding-latency", type=float, default=Latency.embedding)
+    parser.add_argument("--vector-latency", type=float, default=Latency.vector)
+    args = parser.parse_args()
+
+    latency = Latency(llm=args.llm_latency, embedding=args.embedding_latency, vector=args.vector_latency)
+    uvicorn.run(create_app(build_corpus(args.documents, args.pages), latency), host="127.0.0.1", port=args.port)
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Offline end-to-end benchmarks for the query pipeline.
+
+Starts the stand-in services from benchmarks.fake_services, serves a
+generated PDF/DOCX corpus, and runs each scenario against QueryEngine (or
+the FastAPI app for concurrent clients) in its own subprocess, so peak RSS
+and metrics are per scenario. Reports throughput, latency percentiles,
+per-stage time from app.metrics, and peak RSS.
+
+    python -m benchmarks.run
+    python -m benchmarks.run --scenarios cold_doc,warm_doc --llm-latency 0.8 --json report.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from benchmarks.corpus import QUESTIONS, build_corpus
+from benchmarks.fake_services import FakePineconeIndex, Latency, ServiceThread, create_app
+
+SCENARIOS = ("cold_doc", "warm_doc", "many_questions", "concurrent_clients")
+RESULT_PREFIX = "BENCH_RESULT "
+API_KEY = "bench-key"
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmarks")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset of " + ", ".join(SCENARIOS))
+    parser.add_argument("--documents", type=int, default=8, help="Documents in the generated corpus")
+    parser.add_argument("--pages", type=int, default=40, help="Pages per document")
+    parser.add_argument("--requests", type=int, default=5, help="Requests per scenario (per client for concurrent_clients)")
+    parser.add_argument("--questions", type=int, default=5, help="Questions per request")
+    parser.add_argument("--many-questions", type=int, default=40, help="Questions per request in many_questions")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent clients in concurrent_clients")
+    parser.add_argument("--provider", choices=("groq", "openai"), default="groq", help="Primary LLM provider")
+    parser.add_argument("--vector-backend", choices=("local", "pinecone", "lexical"), default="local")
+    parser.add_argument("--llm-latency", type=float, default=Latency.llm)
+    parser.add_argument("--llm-jitter", type=float, default=Latency.llm_jitter)
+    parser.add_argument("--embedding-latency", type=float, default=Latency.embedding)
+    parser.add_argument("--vector-latency", type=float, default=Latency.vector)
+    parser.add_argument("--download-latency", type=float, default=Latency.download)
+    parser.add_argument("--in-process", action="store_true", help="Run scenarios in this process (shared RSS and metrics)")
+    parser.add_argument("--json", dest="json_path", help="Write the full report to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show application output")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--service-url", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def configure(args: argparse.Namespace, service_url: str, cache_dir: str):
+    """Point the application settings at the stand-in services"""
+    from config import settings
+    settings.api_key = API_KEY
+    settings.cache_dir = cache_dir
+    settings.openai_api_key = "bench"
+    settings.openai_base_url = f"{service_url}/v1"
+    settings.groq_api_key = "bench" if args.provider == "groq" else None
+    settings.groq_base_url = service_url
+    settings.pinecone_api_key = None
+    settings.embedding_provider = "openai"
+    settings.vector_backend = "pinecone" if args.vector_backend == "pinecone" else "local"
+    if args.vector_backend == "lexical":
+        settings.retrieval_mode = "lexical"
+
+def build_engine(args: argparse.Namespace, service_url: str):
+    import main
+    engine = main.get_query_engine()
+    if args.vector_backend == "pinecone":
+        engine.vector_store.index = FakePineconeIndex(service_url)
+        engine.vector_store.local_index = None
+    return engine
+
+def question_set(count: int, variant: int) -> List[str]:
+    """count questions cycling through the topics; variant makes them distinct across requests"""
+    return [f"{QUESTIONS[i % len(QUESTIONS)]} (ref {variant}-{i // len(QUESTIONS)})" for i in range(count)]
+
+def document_url(service_url: str, corpus_names: List[str], index: int) -> str:
+    return f"{service_url}/docs/{corpus_names[index % len(corpus_names)]}"
+
+async def run_scenario(name: str, args: argparse.Namespace, service_url: str, corpus_names: List[str]) -> Dict[str, Any]:
+    from app.llm_processor import is_error_answer
+    from app.models import QueryRequest
+    engine = build_engine(args, service_url)
+    latencies: List[float] = []
+    questions_answered = 0
+    error_answers = 0
+
+    def count_answers(answers: List[str]):
+        # Error strings come back as answers too; they must not count as throughput
+        nonlocal questions_answered, error_answers
+        errors = sum(1 for answer in answers if is_error_answer(answer))
+        error_answers += errors
+        questions_answered += len(answers) - errors
+
+    async def timed_request(url: str, questions: List[str]):
+        start = time.perf_counter()
+        response = await engine.process_query_request(QueryRequest(documents=url, questions=questions))
+        latencies.append(time.perf_counter() - start)
+        count_answers(response.answers)
+
+    if name in ("warm_doc", "many_questions"):
+        from app.metrics import registry
+        await engine.prepare_document(document_url(service_url, corpus_names, 0))
+        registry.reset()
+
+    started = time.perf_counter()
+    if name == "cold_doc":
+        for i in range(args.requests):
+            await timed_request(document_url(service_url, corpus_names, i), question_set(args.questions, i))
+    elif name == "warm_doc":
+        for i in range(args.requests):
+            await timed_request(document_url(service_url, corpus_names, 0), question_set(args.questions, i))
+    elif name == "many_questions":
+        for i in range(args.requests):
+            await timed_request(document_url(service_url, corpus_names, 0), question_set(args.many_questions, i))
+    elif name == "concurrent_clients":
+        import httpx
+        import main
+        transport = httpx.ASGITransport(app=main.app)
+        headers = {"Authorization": f"Bearer {API_KEY}"}
+
+        async def client(client_id: int):
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+                for i in range(args.requests):
+                    body = {
+                        "documents": document_url(service_url, corpus_names, client_id % 2),
+                        "questions": question_set(args.questions, client_id * args.requests + i)
+                    }
+                    start = time.perf_counter()
+                    response = await http.post("/hackrx/run", json=body, headers=headers)
+                    latencies.append(time.perf_counter() - start)
+                    response.raise_for_status()
+                    count_answers(response.json()["answers"])
+
+        await asyncio.gather(*[client(c) for c in range(args.clients)])
+    else:
+        raise Exception(f"Unknown scenario: {name}")
+    wall = time.perf_counter() - started
+
+    return summarize(name, latencies, questions_answered, error_answers, wall)
+
+def summarize(name: str, latencies: List[float], questions: int, errors: int, wall: float) -> Dict[str, Any]:
+    from app.metrics import answer_sources, registry
+    snapshot = registry.snapshot()
+    stages = {}
+    for key, values in snapshot.get("hackrx_stage_seconds", {}).items():
+        stages[key.split("=", 1)[1]] = {
+            "count": values["count"],
+            "total": values["count"] * values["mean"],
+            "p50": values.get("p50", 0.0),
+            "p95": values.get("p95", 0.0)
+        }
+    samples = np.asarray(latencies or [0.0])
+    return {
+        "scenario": name,
+        "requests": len(latencies),
+        "questions": questions,
+        "error_answers": errors,
+        "wall_seconds": wall,
+        "requests_per_second": len(latencies) / wall if wall else 0.0,
+        "questions_per_second": questions / wall if wall else 0.0,
+        "latency": {
+            "mean": float(samples.mean()),
+            "p50": float(np.percentile(samples, 50)),
+            "p95": float(np.percentile(samples, 95)),
+            "p99": float(np.percentile(samples, 99)),
+            "max": float(samples.max())
+        },
+        "stages": stages,
+        "answers_without_llm": answer_sources()["without_llm_ratio"],
+        "counters": {
+            name: values for name, values in snapshot.items() if name != "hackrx_stage_seconds" and not name.endswith("_seconds")
+        },
+        # ru_maxrss is reported in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+def run_worker(args: argparse.Namespace) -> Dict[str, Any]:
+    """Run one scenario in this process against already running services"""
+    cache_dir = tempfile.mkdtemp(prefix="hackrx-bench-")
+    try:
+        configure(args, args.service_url, cache_dir)
+        corpus_names = sorted(build_corpus(args.documents, 1))
+        output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with output:
+            return asyncio.run(run_scenario(args.worker, args, args.service_url, corpus_names))
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+def worker_command(args: argparse.Namespace, scenario: str, service_url: str) -> List[str]:
+    command = [sys.executable, "-m", "benchmarks.run", "--worker", scenario, "--service-url", service_url]
+    for option in ("documents", "pages", "requests", "questions", "many_questions", "clients", "provider", "vector_backend"):
+        command += [f"--{option.replace('_', '-')}", str(getattr(args, option))]
+    if args.verbose:
+        command.append("--verbose")
+    return command
+
+def print_report(results: List[Dict[str, Any]]):
+    print(f"\n{'scenario':<20}{'reqs':>6}{'req/s':>9}{'q/s':>9}{'errors':>8}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'rss MB':>9}")
+    for result in results:
+        latency = result["latency"]
+        print(f"{result['scenario']:<20}{result['requests']:>6}{result['requests_per_second']:>9.2f}"
+              f"{result['questions_per_second']:>9.2f}{result['error_answers']:>8}{latency['p50']:>9.3f}{latency['p95']:>9.3f}"
+              f"{latency['p99']:>9.3f}{result['peak_rss_mb']:>9.1f}")
+    for result in results:
+        print(f"\n{result['scenario']} - time by stage (summed across concurrent work), "
+              f"{result['answers_without_llm']:.0%} of answers without the LLM")
+        stages = sorted(result["stages"].items(), key=lambda item: item[1]["total"], reverse=True)
+        for stage, values in stages:
+            print(f"  {stage:<16}{values['total']:>9.3f}s  n={values['count']:<6}"
+                  f"p50={values['p50'] * 1000:>8.1f}ms  p95={values['p95'] * 1000:>8.1f}ms")
+
+def main(argv: List[str] = None):
+    args = parse_args(argv)
+    if args.worker:
+        result = run_worker(args)
+        print(RESULT_PREFIX + json.dumps(result))
+        return
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    for name in scenarios:
+        if name not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario: {name}")
+
+    latency = Latency(
+        llm=args.llm_latency, llm_jitter=args.llm_jitter, embedding=args.embedding_latency,
+        vector=args.vector_latency, download=args.download_latency
+    )
+    print(f"📄 Generating corpus: {args.documents} documents x {args.pages} pages")
+    corpus = build_corpus(args.documents, args.pages)
+    service = ServiceThread(create_app(corpus, latency)).start()
+    print(f"✅ Stand-in services at {service.url}")
+
+    results = []
+    try:
+        for name in scenarios:
+            print(f"⏱️ Running {name}...")
+            if args.in_process:
+                args.worker, args.service_url = name, service.url
+                results.append(run_worker(args))
+                args.worker = None
+                continue
+            completed = subprocess.run(
+                worker_command(args, name, service.url),
+                stdout=subprocess.PIPE, text=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            )
+            lines = [line for line in completed.stdout.splitlines() if line.startswith(RESULT_PREFIX)]
+            if completed.returncode != 0 or not lines:
+                print(completed.stdout[-2000:])
+                raise SystemExit(f"Scenario {name} failed (exit code {completed.returncode})")
+            results.append(json.loads(lines[-1][len(RESULT_PREFIX):]))
+    finally:
+        service.stop()
+
+    print_report(results)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+        print(f"\n✅ Report written to {args.json_path}")
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,8 @@ class Settings(BaseSettings):
     pinecone_api_key: Optional[str] = None
     pinecone_environment: Optional[str] = None
     pinecone_index_name: str = "bajaj-documents"
+    openai_base_url: Optional[str] = None  # Override the API endpoint (e.g. local stand-ins for benchmarks)
+    groq_base_url: Optional[str] = None
     
     # Server Configuration
     host: str = "0.0.0.0"
@@ -21,11 +23,121 @@ class Settings(BaseSettings):
     llm_model: str = "gpt-3.5-turbo"  # Changed from gpt-4 to gpt-3.5-turbo
     max_tokens: int = 2000  # Reduced for faster responses
     temperature: float = 0.1
+    groq_model: str = "llama3-8b-8192"  # Fast model
+    groq_max_tokens: int = 1000  # Reduced for speed
+    groq_context_tokens: int = 2500  # Budget for retrieved context in a prompt
+    openai_context_tokens: int = 2500
+    
+    # LLM Scheduling (rpm/tpm of 0 disables that limit)
+    groq_max_concurrency: int = 8
+    groq_rpm: int = 0
+    groq_tpm: int = 0
+    openai_max_concurrency: int = 8
+    openai_rpm: int = 0
+    openai_tpm: int = 0
+    llm_max_retries: int = 3  # Retries on 429/5xx with jittered backoff
+    
+    # LLM Provider Routing
+    llm_latency_routing: bool = True  # Prefer the provider with the lowest expected latency once it is clearly faster
+    llm_routing_margin: float = 1.5  # Expected-latency ratio at which the first provider is moved down
+    llm_hedging_enabled: bool = True  # Race the next provider when the current one is slower than usual
+    llm_hedge_percentile: float = 95.0  # Latency percentile of the current provider used as hedge delay
+    llm_hedge_min_samples: int = 20  # Samples needed before the hedge delay percentile is trusted
+    llm_hedge_initial_delay: float = 3.0  # Hedge delay until then
+    llm_hedge_min_delay: float = 0.25
+    llm_hedge_max_delay: float = 10.0
+    llm_latency_window: int = 200  # Recent latencies kept per provider
+    llm_ewma_alpha: float = 0.2  # Weight of the newest sample in latency/error averages
+    llm_breaker_failures: int = 5  # Consecutive failures that open a provider's circuit
+    llm_breaker_cooldown: float = 30.0  # Seconds a circuit stays open before a probe call
+    
+    # Multi-question packing: several questions answered by one LLM call
+    llm_pack_questions: bool = False
+    llm_pack_max_questions: int = 5
+    llm_pack_max_tokens: int = 1500
+    
+    # Embeddings
+    embedding_provider: str = "openai"  # "openai" or "sentence-transformers"
+    local_embedding_model: str = "all-MiniLM-L6-v2"  # Used by the sentence-transformers provider
+    embedding_batch_size: int = 128  # Inputs per embeddings request
+    embedding_max_concurrency: int = 4  # Embeddings requests in flight
+    embedding_max_retries: int = 3
+    embedding_cache_enabled: bool = True  # Persist vectors under cache_dir
+    
+    # Vector Storage
+    vector_backend: str = "auto"  # "auto", "pinecone", "local" or "fallback"
+    pinecone_upsert_batch_size: int = 100  # Vectors per upsert request
+    pinecone_upsert_concurrency: int = 4  # Upsert requests in flight
+    pinecone_query_concurrency: int = 8  # Query requests in flight when retrieving for many questions
+    local_index_metric: str = "cosine"  # "cosine" or "dot"
+    local_index_max_namespaces: int = 64  # Document indexes kept loaded
+    lexical_index_max_documents: int = 64  # BM25 indexes kept loaded
+    
+    # Retrieval
+    retrieval_mode: str = "hybrid"  # "dense", "lexical" or "hybrid"
+    retrieval_top_k: int = 3  # Chunks passed to the LLM per question
+    hybrid_fusion: str = "rrf"  # "rrf" (reciprocal rank) or "weighted"
+    hybrid_rrf_k: int = 60
+    hybrid_dense_weight: float = 0.6  # Weighted fusion only; lexical gets the remainder
+    hybrid_candidates: int = 10  # Candidates fetched from each index before fusion
+    
+    # Reranking (local cross-encoder, needs sentence-transformers)
+    rerank_enabled: bool = False
+    rerank_model: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    rerank_candidates: int = 12  # Chunks retrieved per question for reranking
+    rerank_top_n: int = 2  # Chunks kept per question after reranking
+    rerank_batch_size: int = 32  # (question, chunk) pairs per model call
+    rerank_workers: int = 2  # Threads running model calls
+    rerank_max_length: int = 512  # Tokens per pair fed to the model
+    rerank_cache_max_entries: int = 16384  # Cached pair scores
+    
+    # Extractive fast path (answer with a retrieved sentence, skipping the LLM)
+    extractive_enabled: bool = False
+    extractive_threshold: float = 0.5  # Minimum confidence to skip the LLM
+    extractive_max_chunks: int = 2  # Top chunks searched for the answer sentence
+    extractive_min_words: int = 5
+    extractive_max_words: int = 60
     
     # Document Processing - Optimized for speed
-    chunk_size: int = 800  # Reduced from 1000
-    chunk_overlap: int = 100  # Reduced from 200
+    chunk_size: int = 200  # Tokens per chunk
+    chunk_overlap: int = 25  # Tokens of whole sentences repeated between chunks
+    tokenizer_encoding: str = "cl100k_base"  # tiktoken encoding used to count tokens
     max_document_size: int = 10 * 1024 * 1024  # 10MB
+    pdf_extract_workers: int = 0  # Worker processes for PDF parsing (0 = CPU count)
+    pdf_pages_per_task: int = 16  # PDFs up to this many pages are parsed in one thread
+    ingest_batch_size: int = 64  # Chunks handed to embedding/indexing at a time
+    
+    # Background Ingestion
+    ingest_workers: int = 2  # Documents ingested concurrently by /api/v1/ingest
+    ingest_queue_size: int = 256  # Pending jobs before submissions are rejected
+    ingest_max_jobs: int = 1024  # Job statuses kept for polling
+    
+    # Document Download
+    download_timeout: float = 30.0  # Seconds per read/write on the download stream
+    download_chunk_size: int = 64 * 1024  # Bytes read per streamed chunk
+    http_max_connections: int = 20
+    http_max_keepalive_connections: int = 10
+    
+    # Document Cache
+    cache_dir: str = ".cache"
+    document_cache_max_entries: int = 32  # Documents kept in memory
+    document_cache_max_bytes: int = 64 * 1024 * 1024  # Chunk text kept in memory
+    document_cache_disk_max_bytes: int = 512 * 1024 * 1024
+    document_cache_max_urls: int = 1024
+    document_cache_ttl: int = 3600  # Seconds before a URL is revalidated
+    
+    # Answer Cache
+    answer_cache_max_entries: int = 4096
+    answer_cache_persist: bool = True  # Also keep answers in cache_dir/answers.sqlite3
+    
+    # Semantic Cache (paraphrased questions reuse earlier answers)
+    semantic_cache_enabled: bool = True
+    semantic_cache_threshold: float = 0.95  # Minimum cosine similarity to reuse an answer
+    semantic_cache_max_per_document: int = 256
+    semantic_cache_max_documents: int = 64
+    
+    # Metrics
+    metrics_trace_headers: bool = True  # Add a Server-Timing header with per-stage durations
     
     class Config:
         env_file = ".env"
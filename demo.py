@@ -56,7 +56,7 @@ async def demo():
     print("\n💾 Cache information:")
     cache_info = query_engine.get_cache_info()
     print(f"Cached documents: {cache_info['cached_documents']}")
-    print(f"Document URLs: {cache_info['document_urls']}")
+    print(f"Cache statistics: {cache_info['stats']}")
     
     print("\n✅ Demo completed successfully!")
 
@@ -1,13 +1,17 @@
 import os
+import json
 import time
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 import uvicorn
 
-from app.models import QueryRequest, QueryResponse
+from app.models import QueryRequest, QueryResponse, IngestRequest, IngestJob
 from app.query_engine import QueryEngine
 from app.auth import verify_api_key
+from app.http_client import close_http_client
+from app.document_processor import shutdown_pdf_pool
+from app.metrics import registry, REQUEST_SECONDS, start_trace, server_timing_header
 from config import settings
 
 # Initialize FastAPI app
@@ -26,6 +30,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-request timing: latency histogram and Server-Timing header
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    trace = start_trace()
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+    route = request.scope.get("route")
+    REQUEST_SECONDS.observe(elapsed, path=getattr(route, "path", "unmatched"), method=request.method)
+    if settings.metrics_trace_headers:
+        trace["total"] = elapsed
+        response.headers["Server-Timing"] = server_timing_header(trace)
+    return response
+
 # Lazy initialization for QueryEngine
 _query_engine = None
 
@@ -35,6 +53,16 @@ def get_query_engine():
         _query_engine = QueryEngine()
     return _query_engine
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop ingestion workers and release pooled HTTP connections and PDF/rerank workers"""
+    if _query_engine is not None:
+        await _query_engine.ingestion.stop()
+        if _query_engine.reranker is not None:
+            _query_engine.reranker.close()
+    await close_http_client()
+    shutdown_pdf_pool()
+
 # Root endpoint
 @app.get("/")
 async def root():
@@ -74,6 +102,71 @@ async def run_query(
             detail=f"Error processing request: {str(e)}"
         )
 
+# Streaming variant of the competition endpoint
+@app.post("/hackrx/run/stream")
+async def run_query_stream(
+    request: QueryRequest,
+    format_: str = Query("sse", alias="format", pattern="^(sse|ndjson)$"),
+    tokens: bool = False,
+    api_key: str = Depends(verify_api_key)
+):
+    """
+    Streams each answer as soon as it is ready, tagged with its question index.
+    format=sse emits server-sent events, format=ndjson one JSON object per line;
+    tokens=true also streams LLM tokens as they arrive.
+    """
+    query_engine = get_query_engine()
+    
+    async def event_stream():
+        async for event in query_engine.stream_query_request(request, stream_tokens=tokens):
+            payload = json.dumps(event)
+            if format_ == "sse":
+                yield f"event: {event['event']}\ndata: {payload}\n\n"
+            else:
+                yield payload + "\n"
+    
+    media_type = "text/event-stream" if format_ == "sse" else "application/x-ndjson"
+    return StreamingResponse(
+        event_stream(),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Background ingestion endpoints
+@app.post("/api/v1/ingest", response_model=IngestJob, status_code=status.HTTP_202_ACCEPTED)
+async def ingest_document(
+    request: IngestRequest,
+    api_key: str = Depends(verify_api_key)
+):
+    """Queue a document for ingestion and return its job"""
+    query_engine = get_query_engine()
+    try:
+        return query_engine.ingestion.submit(request.documents)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e)
+        )
+
+@app.get("/api/v1/ingest/{job_id}", response_model=IngestJob)
+async def get_ingest_job(job_id: str, api_key: str = Depends(verify_api_key)):
+    """Get the status of an ingestion job"""
+    job = get_query_engine().ingestion.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ingestion job not found")
+    return job
+
+# Prometheus metrics endpoint
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Per-stage latency histograms and counters in the Prometheus text format"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/v1/metrics")
+async def get_metrics(api_key: str = Depends(verify_api_key)):
+    """Metrics as JSON, with p50/p95/p99 per stage"""
+    return registry.snapshot()
+
 # Configuration endpoint
 @app.get("/api/v1/config")
 async def get_config(api_key: str = Depends(verify_api_key)):
@@ -93,10 +186,7 @@ async def get_config(api_key: str = Depends(verify_api_key)):
 async def get_cache_info(api_key: str = Depends(verify_api_key)):
     """Get cache information"""
     query_engine = get_query_engine()
-    return {
-        "cache_size": len(query_engine.document_cache),
-        "cached_documents": list(query_engine.document_cache.keys())
-    }
+    return query_engine.get_cache_info()
 
 # Error handlers
 @app.exception_handler(HTTPException)
@@ -0,0 +1,132 @@
+from app.chunker import StructuredChunker, segment_page
+from app.tokenizer import count_tokens
+
+PAGES = [
+    "SECTION 1 DEFINITIONS\n"
+    "A hospital means an institution with at least ten inpatient beds. "
+    "It must be registered with the local authorities. "
+    "It must maintain daily records of patients.\n"
+    "\n"
+    "2.1 Grace Period\n"
+    "A grace period of thirty days is allowed for premium payment. "
+    "Coverage continues during the grace period.",
+    "EXCLUSIONS\n"
+    "Cosmetic surgery is not covered unless required after an accident. "
+    "Dental treatment is excluded except when it follows an injury. "
+    "Spectacles and contact lenses are not covered."
+]
+
+# Extracted PDF text, with lines wrapped wherever the page layout did
+WRAPPED_PAGE = (
+    "SECTION 3 PREMIUM\n"
+    "A grace period of thirty days is\n"
+    "allowed for premium payment. Coverage\n"
+    "continues during it, and the policy remains\n"
+    "in force. Benefits are paid as per the\n"
+    "schedule of benefits, subject to the limits stated in\n"
+    "the policy.\n"
+    "\n"
+    "Maternity expenses are covered after a waiting period of\n"
+    "24 months of continuous coverage."
+)
+
+def chunk_pages(pages, chunk_size, chunk_overlap):
+    chunker = StructuredChunker(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    chunks = []
+    for page_number, page in enumerate(pages, start=1):
+        chunks.extend(chunker.feed(page_number, page))
+    chunks.extend(chunker.flush())
+    return chunks
+
+def test_segment_page_splits_headings_and_sentences():
+    text = "EXCLUSIONS\nDental work is excluded. Spectacles are not covered.\n\n3.1 Waiting Period\nTwo years apply."
+    segments = [(text[start:end], heading) for start, end, heading in segment_page(text)]
+    assert segments == [
+        ("EXCLUSIONS", True),
+        ("Dental work is excluded.", False),
+        ("Spectacles are not covered.", False),
+        ("3.1 Waiting Period", True),
+        ("Two years apply.", False)
+    ]
+
+def test_offsets_match_joined_document_text():
+    document = "\n".join(PAGES)
+    for chunk in chunk_pages(PAGES, chunk_size=40, chunk_overlap=15):
+        metadata = chunk.metadata
+        assert document[metadata["char_start"]:metadata["char_end"]] == chunk.content
+        assert metadata["char_count"] == len(chunk.content)
+
+def test_chunks_end_on_sentence_boundaries_and_respect_size():
+    chunks = chunk_pages(PAGES, chunk_size=25, chunk_overlap=0)
+    assert len(chunks) > 3
+    for chunk in chunks:
+        assert chunk.content.rstrip()[-1] in ".!?"
+        assert count_tokens(chunk.content) <= 25
+
+def test_headings_start_new_chunks_and_name_the_section():
+    chunks = chunk_pages(PAGES, chunk_size=500, chunk_overlap=0)
+    assert [chunk.metadata["section"] for chunk in chunks] == ["SECTION 1 DEFINITIONS", "2.1 Grace Period", "EXCLUSIONS"]
+    assert chunks[1].content.startswith("2.1 Grace Period\nA grace period")
+    assert chunks[2].metadata["page_start"] == 2
+
+def test_overlap_carries_trailing_sentences_within_a_section():
+    chunks = chunk_pages(PAGES, chunk_size=25, chunk_overlap=15)
+    overlapped = 0
+    for previous, current in zip(chunks, chunks[1:]):
+        if current.metadata["section"] != previous.metadata["section"]:
+            assert current.metadata["char_start"] >= previous.metadata["char_end"]
+            continue
+        if current.metadata["char_start"] < previous.metadata["char_end"]:
+            overlapped += 1
+            # The shared text is whole sentences from the end of the previous chunk
+            shared = previous.content[current.metadata["char_start"] - previous.metadata["char_start"]:]
+            assert current.content.startswith(shared)
+            assert count_tokens(shared) <= 15
+    assert overlapped > 0
+
+def test_no_overlap_when_disabled():
+    chunks = chunk_pages(PAGES, chunk_size=25, chunk_overlap=0)
+    for previous, current in zip(chunks, chunks[1:]):
+        assert current.metadata["char_start"] > previous.metadata["char_end"]
+
+def test_oversized_sentence_is_split_at_clauses():
+    sentence = "Expenses are covered for " + ", ".join(f"item number {i}" for i in range(40)) + "."
+    chunks = chunk_pages([sentence], chunk_size=30, chunk_overlap=0)
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert count_tokens(chunk.content) <= 30
+        assert sentence[chunk.metadata["char_start"]:chunk.metadata["char_end"]] == chunk.content
+
+def test_trailing_heading_is_not_a_chunk_of_its_own():
+    chunks = chunk_pages(PAGES + ["ANNEXURE A"], chunk_size=500, chunk_overlap=0)
+    assert [chunk.metadata["section"] for chunk in chunks] == ["SECTION 1 DEFINITIONS", "2.1 Grace Period", "EXCLUSIONS"]
+    assert "ANNEXURE" not in chunks[-1].content
+
+def test_heading_only_document_still_produces_a_chunk():
+    chunks = chunk_pages(["SCHEDULE OF BENEFITS"], chunk_size=500, chunk_overlap=0)
+    assert [chunk.content for chunk in chunks] == ["SCHEDULE OF BENEFITS"]
+
+def test_wrapped_lines_continue_the_sentence():
+    segments = [(WRAPPED_PAGE[start:end], heading) for start, end, heading in segment_page(WRAPPED_PAGE)]
+    assert segments == [
+        ("SECTION 3 PREMIUM", True),
+        ("A grace period of thirty days is\nallowed for premium payment.", False),
+        ("Coverage\ncontinues during it, and the policy remains\nin force.", False),
+        ("Benefits are paid as per the\nschedule of benefits, subject to the limits stated in\nthe policy.", False),
+        ("Maternity expenses are covered after a waiting period of\n24 months of continuous coverage.", False)
+    ]
+
+def test_lowercase_keyword_line_is_not_a_heading():
+    chunks = chunk_pages([WRAPPED_PAGE], chunk_size=500, chunk_overlap=0)
+    assert [chunk.metadata["section"] for chunk in chunks] == ["SECTION 3 PREMIUM"]
+
+def test_wrapped_chunks_and_overlap_hold_whole_sentences():
+    chunks = chunk_pages([WRAPPED_PAGE], chunk_size=30, chunk_overlap=15)
+    assert len(chunks) > 2
+    for previous, current in zip(chunks, chunks[1:]):
+        assert current.content.rstrip()[-1] in ".!?"
+        if current.metadata["char_start"] < previous.metadata["char_end"]:
+            shared = previous.content[current.metadata["char_start"] - previous.metadata["char_start"]:]
+            assert shared[0].isupper()
+    for chunk in chunks:
+        assert WRAPPED_PAGE[chunk.metadata["char_start"]:chunk.metadata["char_end"]] == chunk.content
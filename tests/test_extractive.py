@@ -0,0 +1,73 @@
+from app.extractive import confident_answer, extract_answer
+from app.models import SearchResult
+from config import settings
+
+POLICY = SearchResult(
+    content=(
+        "GRACE PERIOD\n"
+        "The grace period for premium payment is thirty days. "
+        "Coverage continues during the grace period. "
+        "Dental treatment is excluded from coverage unless it follows an accident. "
+        "Maternity expenses are covered after a waiting period of 24 months. "
+        "Cataract surgery has a waiting period of two years."
+    ),
+    score=0.9
+)
+
+WRAPPED = SearchResult(
+    content=(
+        "WAITING PERIODS\n"
+        "Maternity expenses are covered after a waiting period of\n"
+        "24 months of continuous coverage. Claims for cataract\n"
+        "surgery are payable after two years."
+    ),
+    score=0.9
+)
+
+def test_disabled_by_default():
+    assert settings.extractive_enabled is False
+
+def test_spelled_out_number_answers_quantity_question():
+    answer = extract_answer("What is the grace period for premium payment?", [POLICY])
+    assert answer.text == "The grace period for premium payment is thirty days."
+    assert answer.confidence >= settings.extractive_threshold
+
+def test_digits_answer_quantity_question():
+    assert confident_answer("What is the waiting period for maternity expenses?", [POLICY]) == (
+        "Maternity expenses are covered after a waiting period of 24 months."
+    )
+    assert confident_answer("What is the waiting period for cataract surgery?", [POLICY]) == (
+        "Cataract surgery has a waiting period of two years."
+    )
+
+def test_yes_no_questions_are_left_to_the_llm():
+    assert extract_answer("Is dental work excluded from coverage?", [POLICY]) is None
+    assert extract_answer("Does the policy cover maternity expenses?", [POLICY]) is None
+
+def test_quantity_question_without_a_number_stays_below_threshold():
+    chunk = SearchResult(
+        content="Coverage continues during the grace period. Claims are settled by the insurer after review.",
+        score=0.9
+    )
+    answer = extract_answer("What is the grace period for premium payment?", [chunk])
+    assert answer is not None
+    assert answer.confidence < settings.extractive_threshold
+    assert confident_answer("What is the grace period for premium payment?", [chunk]) is None
+
+def test_competing_sentences_stay_below_threshold():
+    chunk = SearchResult(
+        content=(
+            "The waiting period for pre-existing diseases is 36 months. "
+            "The waiting period for specified diseases is 24 months."
+        ),
+        score=0.9
+    )
+    assert confident_answer("What is the waiting period for diseases?", [chunk]) is None
+
+def test_single_term_question_is_not_answered():
+    assert extract_answer("Maternity?", [POLICY]) is None
+
+def test_sentences_wrapped_across_lines_keep_their_numbers():
+    assert confident_answer("What is the waiting period for maternity expenses?", [WRAPPED]) == (
+        "Maternity expenses are covered after a waiting period of 24 months of continuous coverage."
+    )